@@ -0,0 +1,231 @@
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+
+# --- Configuration ---
+# Lanes in strict priority order: a lane never starts work while a higher-priority lane has requests queued,
+# or while a higher-priority lane with a busy_fraction has at least that share of its slots in flight.
+# Index maintenance has its own lowest-priority lane, so a long run never holds the admin slot.
+LANE_ORDER = ["interactive", "admin", "ingestion", "maintenance"]
+
+# Queries take an interactive slot only for their CPU-bound steps (FAQ match, embedding, retrieval), never
+# while awaiting the chat model, so the interactive concurrency bounds CPU work and defaults to the core count.
+# Admin, ingestion and maintenance work does not start while interactive load is at its busy_fraction, so it
+# yields to queries before they have to queue; set ADMISSION_INTERACTIVE_BUSY_FRACTION to 1 to yield only
+# when every interactive slot is taken. Lanes without a busy_fraction only block lower lanes by queueing.
+LANE_CONFIG = {
+    "interactive": {
+        "max_concurrency": int(os.getenv("ADMISSION_INTERACTIVE_CONCURRENCY", str(os.cpu_count() or 4))),
+        "max_queue": int(os.getenv("ADMISSION_INTERACTIVE_QUEUE", "128")),
+        "queue_timeout": float(os.getenv("ADMISSION_INTERACTIVE_TIMEOUT", "10")),
+        "busy_fraction": float(os.getenv("ADMISSION_INTERACTIVE_BUSY_FRACTION", "0.75")),
+    },
+    "admin": {
+        "max_concurrency": int(os.getenv("ADMISSION_ADMIN_CONCURRENCY", "1")),
+        "max_queue": int(os.getenv("ADMISSION_ADMIN_QUEUE", "2")),
+        "queue_timeout": float(os.getenv("ADMISSION_ADMIN_TIMEOUT", "30")),
+    },
+    "ingestion": {
+        "max_concurrency": int(os.getenv("ADMISSION_INGESTION_CONCURRENCY", "2")),
+        "max_queue": int(os.getenv("ADMISSION_INGESTION_QUEUE", "32")),
+        "queue_timeout": float(os.getenv("ADMISSION_INGESTION_TIMEOUT", "60")),
+    },
+    "maintenance": {
+        "max_concurrency": int(os.getenv("ADMISSION_MAINTENANCE_CONCURRENCY", "1")),
+        "max_queue": int(os.getenv("ADMISSION_MAINTENANCE_QUEUE", "1")),
+        "queue_timeout": float(os.getenv("ADMISSION_MAINTENANCE_TIMEOUT", "300")),
+    },
+}
+
+# Weight of the latest request in the moving average of service time used for Retry-After.
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed: 429 when its queue is full, 503 when it waited too long."""
+
+    def __init__(self, lane, status, retry_after, reason):
+        super().__init__(reason)
+        self.lane = lane
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+    def to_payload(self):
+        return {
+            "error": "The AI service is busy. Please retry shortly.",
+            "reason": self.reason,
+            "lane": self.lane,
+            "retry_after": self.retry_after,
+        }
+
+
+class _Waiter:
+    def __init__(self, lane, wake):
+        self.lane = lane
+        self.wake = wake
+        self.granted = False
+
+
+class AdmissionController:
+    """Bounded per-lane queues and concurrency limits with strict priority between lanes."""
+
+    def __init__(self, lane_config=LANE_CONFIG, lane_order=LANE_ORDER):
+        self.lane_config = lane_config
+        self.lane_order = lane_order
+        self._lock = threading.Lock()
+        self._running = {lane: 0 for lane in lane_order}
+        self._waiting = {lane: deque() for lane in lane_order}
+        self._service_time = {lane: None for lane in lane_order}
+        self._counters = {lane: {"admitted": 0, "rejected_full": 0, "rejected_timeout": 0} for lane in lane_order}
+
+    # --- Scheduling (all called with the lock held) ---
+
+    def _busy(self, lane):
+        """True if the lane has at least its busy_fraction of slots in flight."""
+        fraction = self.lane_config[lane].get("busy_fraction")
+        if fraction is None:
+            return False
+        return self._running[lane] >= max(1, math.ceil(fraction * self.lane_config[lane]["max_concurrency"]))
+
+    def _higher_priority_busy(self, lane):
+        for other in self.lane_order:
+            if other == lane:
+                return False
+            if self._waiting[other] or self._busy(other):
+                return True
+        return False
+
+    def _can_start(self, lane):
+        if self._running[lane] >= self.lane_config[lane]["max_concurrency"]:
+            return False
+        return not self._higher_priority_busy(lane)
+
+    def _start(self, lane):
+        self._running[lane] += 1
+        self._counters[lane]["admitted"] += 1
+
+    def _dispatch(self):
+        for lane in self.lane_order:
+            queue = self._waiting[lane]
+            while queue and self._running[lane] < self.lane_config[lane]["max_concurrency"]:
+                waiter = queue.popleft()
+                self._start(lane)
+                waiter.granted = True
+                waiter.wake()
+            if queue or self._busy(lane):
+                # Strict priority: nothing below a lane with queued work, or at its busy fraction, may start
+                return
+
+    def _retry_after(self, lane):
+        average = self._service_time[lane] or 1.0
+        queued = len(self._waiting[lane]) + 1
+        concurrency = self.lane_config[lane]["max_concurrency"]
+        return max(1, math.ceil(average * queued / concurrency))
+
+    def _try_enter(self, lane, wake):
+        """Starts immediately, enqueues a waiter, or raises if the lane's queue is full."""
+        if lane not in self.lane_config:
+            raise ValueError(f"Unknown admission lane: {lane}")
+        if not self._waiting[lane] and self._can_start(lane):
+            self._start(lane)
+            return None
+        if len(self._waiting[lane]) >= self.lane_config[lane]["max_queue"]:
+            self._counters[lane]["rejected_full"] += 1
+            raise AdmissionRejected(lane, 429, self._retry_after(lane), "queue_full")
+        waiter = _Waiter(lane, wake)
+        self._waiting[lane].append(waiter)
+        return waiter
+
+    def _abandon(self, waiter):
+        """Handles a waiter that gave up. Returns True if it had already been granted a slot."""
+        if waiter.granted:
+            return True
+        self._waiting[waiter.lane].remove(waiter)
+        self._dispatch()
+        return False
+
+    def _release(self, lane, started_at):
+        elapsed = time.monotonic() - started_at
+        previous = self._service_time[lane]
+        self._service_time[lane] = elapsed if previous is None else (
+            SERVICE_TIME_SMOOTHING * elapsed + (1 - SERVICE_TIME_SMOOTHING) * previous
+        )
+        self._running[lane] -= 1
+        self._dispatch()
+
+    def _timed_out(self, lane):
+        self._counters[lane]["rejected_timeout"] += 1
+        return AdmissionRejected(lane, 503, self._retry_after(lane), "queue_timeout")
+
+    # --- Public API ---
+
+    @contextmanager
+    def admit(self, lane):
+        """Blocks the calling thread until the lane admits it; raises AdmissionRejected when shedding load."""
+        event = threading.Event()
+        with self._lock:
+            waiter = self._try_enter(lane, event.set)
+
+        if waiter is not None and not event.wait(self.lane_config[lane]["queue_timeout"]):
+            with self._lock:
+                if not self._abandon(waiter):
+                    raise self._timed_out(lane)
+
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._release(lane, started_at)
+
+    @asynccontextmanager
+    async def admit_async(self, lane):
+        """Async variant of admit that waits on the event loop instead of a thread."""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+
+        with self._lock:
+            waiter = self._try_enter(lane, wake)
+
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(granted), self.lane_config[lane]["queue_timeout"])
+            except asyncio.TimeoutError:
+                with self._lock:
+                    if not self._abandon(waiter):
+                        raise self._timed_out(lane)
+            except asyncio.CancelledError:
+                with self._lock:
+                    if self._abandon(waiter):
+                        self._release(lane, time.monotonic())
+                raise
+
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._release(lane, started_at)
+
+    def stats(self):
+        """Per-lane load and shedding counters"""
+        with self._lock:
+            return {
+                lane: {
+                    "running": self._running[lane],
+                    "queued": len(self._waiting[lane]),
+                    "max_concurrency": self.lane_config[lane]["max_concurrency"],
+                    "max_queue": self.lane_config[lane]["max_queue"],
+                    "avg_service_seconds": round(self._service_time[lane] or 0.0, 3),
+                    **self._counters[lane],
+                }
+                for lane in self.lane_order
+            }
@@ -0,0 +1,139 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+# Importing main loads the models and initializes the knowledge system, exactly as the Flask app does.
+# Its globals are reassigned on refresh, so they are always read through the module.
+import main
+from main import CORS_ORIGINS, admission, answer_query_flow
+from query_flow import arun_flow
+from admission import AdmissionRejected
+
+# --- Configuration ---
+# Embedding, vector search and the remaining synchronous handlers run on this bounded pool,
+# so the event loop stays free to hold many requests that are waiting on the chat model.
+ASGI_CPU_WORKERS = int(os.getenv("ASGI_CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Ingestion and admin handlers (document processing, system refresh, snapshot export) run on their
+# own pool, so long writes never occupy the threads queries need.
+ASGI_BACKGROUND_WORKERS = int(os.getenv("ASGI_BACKGROUND_WORKERS", "2"))
+
+cpu_executor = ThreadPoolExecutor(max_workers=ASGI_CPU_WORKERS, thread_name_prefix="scholara-cpu")
+background_executor = ThreadPoolExecutor(max_workers=ASGI_BACKGROUND_WORKERS, thread_name_prefix="scholara-background")
+
+
+async def run_blocking(fn, *args, executor=cpu_executor):
+    """Run a CPU-bound or blocking call on a bounded executor, the query pool by default"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, fn, *args)
+
+
+async def read_json(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+async def aanswer_query(data):
+    """Async driver for main's /query flow: the same steps, with awaited chat model calls"""
+    return await arun_flow(answer_query_flow(data), run_blocking, admit=lambda: admission.admit_async("interactive"))
+
+
+# -------------------------------
+# ASGI Routes
+# -------------------------------
+
+async def query_documents(request):
+    data = await read_json(request)
+    if data is None:
+        return JSONResponse({"error": "Missing query."}, status_code=400)
+    payload, status = await aanswer_query(data)
+    return JSONResponse(payload, status_code=status)
+
+
+async def process_document_endpoint(request):
+    data = await read_json(request)
+    if data is None:
+        return JSONResponse({"error": "Missing title or text content."}, status_code=400)
+    async with admission.admit_async("ingestion"):
+        payload, status = await run_blocking(main.process_document, data, executor=background_executor)
+    return JSONResponse(payload, status_code=status)
+
+
+async def get_stats(request):
+    payload, status = await run_blocking(main.platform_stats)
+    return JSONResponse(payload, status_code=status)
+
+
+async def health_check(request):
+    payload, status = main.health_status()
+    return JSONResponse(payload, status_code=status)
+
+
+async def refresh_system_knowledge(request):
+    async with admission.admit_async("admin"):
+        payload, status = await run_blocking(main.refresh_system, executor=background_executor)
+    return JSONResponse(payload, status_code=status)
+
+
+async def export_snapshot_endpoint(request):
+    async with admission.admit_async("admin"):
+        payload, status = await run_blocking(main.export_index_snapshot, executor=background_executor)
+    return JSONResponse(payload, status_code=status)
+
+
+async def start_maintenance_endpoint(request):
+    data = await read_json(request)
+    payload, status = main.start_maintenance(data)
+    return JSONResponse(payload, status_code=status)
+
+
+async def maintenance_status_endpoint(request):
+    payload, status = main.maintenance_status()
+    return JSONResponse(payload, status_code=status)
+
+
+async def test_query(request):
+    data = await read_json(request)
+    if data is None:
+        return JSONResponse({"error": "Missing test query"}, status_code=400)
+    # run_test_query admits its own search step, so the classification call holds no slot
+    payload, status = await run_blocking(main.run_test_query, data)
+    return JSONResponse(payload, status_code=status)
+
+
+async def handle_admission_rejected(request, exc):
+    return JSONResponse(exc.to_payload(), status_code=exc.status, headers={"Retry-After": str(exc.retry_after)})
+
+
+app = Starlette(
+    routes=[
+        Route('/process-document', process_document_endpoint, methods=['POST']),
+        Route('/query', query_documents, methods=['POST']),
+        Route('/stats', get_stats, methods=['GET']),
+        Route('/health', health_check, methods=['GET']),
+        Route('/refresh-system', refresh_system_knowledge, methods=['POST']),
+        Route('/export-snapshot', export_snapshot_endpoint, methods=['POST']),
+        Route('/maintenance', start_maintenance_endpoint, methods=['POST']),
+        Route('/maintenance', maintenance_status_endpoint, methods=['GET']),
+        Route('/test-query', test_query, methods=['POST']),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=CORS_ORIGINS, allow_methods=["*"], allow_headers=["*"]),
+    ],
+    exception_handlers={AdmissionRejected: handle_admission_rejected},
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("🚀 Starting Scholara Collective AI Assistant (async serving)...")
+    uvicorn.run(app, host='0.0.0.0', port=8000)
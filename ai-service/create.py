@@ -1,10 +1,34 @@
 import os
+import re
+import json
+import hashlib
+import threading
+import unicodedata
+import chromadb
 from langchain.docstore.document import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
 
+from embedding_worker import get_ingestion_pool
+from near_duplicates import get_near_duplicate_index, minhash_signature, NEAR_DUPLICATE_ACTION
+from lexical_index import get_lexical_index
+from ingestion_manifest import get_ingestion_manifest
+from embedding_backends import (
+    EMBEDDING_MISMATCH_POLICY, EmbeddingMismatch, check_collection, collection_fingerprint,
+    embedding_fingerprint, fingerprint_metadata,
+)
+
 # --- Configuration ---
 CHROMA_DB_PATH = "./chroma_db"
+MIGRATION_PAGE_SIZE = 500
+# A migration re-embeds into "<name>_migration", moves the old collection to "<name>_premigration",
+# renames the staging collection into place and only then drops the old one.
+MIGRATION_STAGING_SUFFIX = "_migration"
+MIGRATION_BACKUP_SUFFIX = "_premigration"
+MIGRATION_STATE_KEY = "migration_state"
+
+# Embedding batches stream back from the worker pool; every write to the index goes through this lock.
+_index_writer_lock = threading.Lock()
 
 def get_chroma_db(embeddings):
     """Loads or creates the ChromaDB instance."""
@@ -22,16 +46,236 @@ def get_chroma_db(embeddings):
         print(f"ChromaDB not found or empty at {CHROMA_DB_PATH}. A new one will be created upon first document processing.")
         return None
 
+def _swap_in_migrated(client, name, staging, embeddings):
+    """
+    Replaces collection `name` with a fully copied staging collection. Every step leaves either the
+    old or the new collection under a known name, so an interrupted swap is finished on the next start.
+    """
+    backup_name = name + MIGRATION_BACKUP_SUFFIX
+    names = [collection.name for collection in client.list_collections()]
+    if name in names:
+        if backup_name in names:
+            client.delete_collection(backup_name)
+        client.get_collection(name).modify(name=backup_name)
+    staging.modify(name=name, metadata=fingerprint_metadata(embeddings))
+    client.delete_collection(backup_name)
+
+def _resume_migration(embeddings):
+    """
+    Finishes or cleans up a migration a previous process did not complete: a fully copied staging
+    collection is swapped in, a partly copied one is dropped (the old collection is then still in
+    place), and a backup left after a finished swap is removed.
+    """
+    if not (os.path.exists(CHROMA_DB_PATH) and os.listdir(CHROMA_DB_PATH)):
+        return
+    client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
+    names = [collection.name for collection in client.list_collections()]
+    for staging_name in [n for n in names if n.endswith(MIGRATION_STAGING_SUFFIX)]:
+        name = staging_name[:-len(MIGRATION_STAGING_SUFFIX)]
+        staging = client.get_collection(staging_name)
+        copied = (staging.metadata or {}).get(MIGRATION_STATE_KEY) == "copied"
+        if copied and collection_fingerprint(staging) == embedding_fingerprint(embeddings):
+            print(f"Finishing the interrupted migration of collection '{name}'...")
+            _swap_in_migrated(client, name, staging, embeddings)
+        else:
+            print(f"Dropping the partial migration of collection '{name}'; it will be re-run if still needed.")
+            client.delete_collection(staging_name)
+            backup_name = name + MIGRATION_BACKUP_SUFFIX
+            if backup_name in names and name not in names:
+                client.get_collection(backup_name).modify(name=name)
+    names = [collection.name for collection in client.list_collections()]
+    for backup_name in [n for n in names if n.endswith(MIGRATION_BACKUP_SUFFIX)]:
+        if backup_name[:-len(MIGRATION_BACKUP_SUFFIX)] in names:
+            client.delete_collection(backup_name)
+
+def _migrate_collection(db, embeddings):
+    """Re-embeds every stored chunk with the configured backend into a fresh collection that replaces the old one."""
+    client = db._client
+    old = db._collection
+    name = old.name
+    staging_name = name + MIGRATION_STAGING_SUFFIX
+    staging = client.create_collection(
+        staging_name, metadata={**fingerprint_metadata(embeddings), MIGRATION_STATE_KEY: "copying"}
+    )
+
+    pool = get_ingestion_pool(embeddings)
+    offset = 0
+    while True:
+        page = old.get(include=["documents", "metadatas"], limit=MIGRATION_PAGE_SIZE, offset=offset)
+        if not page["ids"]:
+            break
+        for start, vectors in pool.embed_documents(page["documents"]):
+            end = start + len(vectors)
+            staging.add(
+                ids=page["ids"][start:end],
+                embeddings=vectors,
+                documents=page["documents"][start:end],
+                metadatas=page["metadatas"][start:end],
+            )
+        offset += len(page["ids"])
+        print(f"Re-embedded {offset} chunks...")
+
+    # From here on a restart swaps the staging collection in instead of re-embedding
+    staging.modify(metadata={**fingerprint_metadata(embeddings), MIGRATION_STATE_KEY: "copied"})
+    _swap_in_migrated(client, name, staging, embeddings)
+    return offset
+
+def verify_chroma_db(embeddings, policy=EMBEDDING_MISMATCH_POLICY):
+    """
+    Checks that the stored chunks were embedded with the configured backend. On a mismatch,
+    raises EmbeddingMismatch, or re-embeds every chunk when the policy is "migrate".
+    """
+    with _index_writer_lock:
+        _resume_migration(embeddings)
+    db = get_chroma_db(embeddings)
+    if db is None:
+        return
+    with _index_writer_lock:
+        if check_collection(db._collection, embeddings) == "match":
+            return
+        stored = collection_fingerprint(db._collection) or "an unknown model"
+        if policy != "migrate":
+            raise EmbeddingMismatch(
+                f"{CHROMA_DB_PATH} was embedded with {stored}, but the service is configured for "
+                f"{embedding_fingerprint(embeddings)}. Set EMBEDDING_MISMATCH_POLICY=migrate to re-embed it."
+            )
+        print(f"Migrating {CHROMA_DB_PATH} from {stored} to {embedding_fingerprint(embeddings)}...")
+        migrated = _migrate_collection(db, embeddings)
+        print(f"Migrated {migrated} chunks to the configured embedding backend.")
+
+def normalize_chunk_text(text):
+    """Normalizes chunk text so trivially different copies (case, spacing, unicode forms) hash the same."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return re.sub(r"\s+", " ", text).strip()
+
+def chunk_id_for(text):
+    """Content address of a chunk: the hash of its normalized text."""
+    return "chunk-" + hashlib.sha256(normalize_chunk_text(text).encode("utf-8")).hexdigest()
+
+def _link_source(metadata, document_title, text_hash):
+    """Adds a source document to a stored chunk's metadata. Chroma metadata is flat, so the lists are JSON strings."""
+    metadata = dict(metadata or {})
+    sources = json.loads(metadata.get("sources") or json.dumps([metadata["source"]] if metadata.get("source") else []))
+    text_hashes = json.loads(metadata.get("text_hashes") or json.dumps([metadata["text_hash"]] if metadata.get("text_hash") else []))
+    if text_hash in text_hashes:
+        return metadata, False
+    sources.append(document_title)
+    text_hashes.append(text_hash)
+    metadata.update({
+        "sources": json.dumps(sources),
+        "text_hashes": json.dumps(text_hashes),
+        "source_count": len(text_hashes),
+    })
+    return metadata, True
+
+def _link_existing_chunks(collection, ids, document_title, text_hash):
+    """
+    Adds the document as a source of those chunks that are already stored and returns their ids.
+    Must be called with the index writer lock held.
+    """
+    existing = collection.get(ids=ids, include=["metadatas"])
+    linked_ids, linked_metadatas = [], []
+    for chunk_id, metadata in zip(existing["ids"], existing["metadatas"]):
+        metadata, changed = _link_source(metadata, document_title, text_hash)
+        if changed:
+            linked_ids.append(chunk_id)
+            linked_metadatas.append(metadata)
+    if linked_ids:
+        collection.update(ids=linked_ids, metadatas=linked_metadatas)
+    return set(existing["ids"])
+
+def _write_chunks(collection, ids, texts, metadatas, vectors, document_title, text_hash):
+    """
+    Adds newly embedded chunks to the collection and the lexical index, or links the document
+    to any that another upload stored meanwhile.
+    Must be called with the index writer lock held.
+    """
+    already_stored = _link_existing_chunks(collection, ids, document_title, text_hash)
+    new_rows = [i for i, chunk_id in enumerate(ids) if chunk_id not in already_stored]
+    if new_rows:
+        collection.add(
+            ids=[ids[i] for i in new_rows],
+            embeddings=[vectors[i] for i in new_rows],
+            documents=[texts[i] for i in new_rows],
+            metadatas=[metadatas[i] for i in new_rows],
+        )
+        get_lexical_index().add_chunks([ids[i] for i in new_rows], [texts[i] for i in new_rows])
+    return len(new_rows)
+
+def _link_to_original(embeddings, original_key, document_title, text_hash):
+    """
+    Adds a near-duplicate upload as a source of the chunks the ingestion manifest recorded for the
+    original document. Returns the linked chunk ids, or [] when the manifest has no finished record
+    of the original or some of its chunks are gone; the upload is then indexed normally instead.
+    """
+    original = get_ingestion_manifest().get(original_key)
+    if original is None or original["status"] not in ("complete", "linked") or not original["chunk_ids"]:
+        return []
+    db = get_chroma_db(embeddings)
+    if db is None:
+        return []
+    with _index_writer_lock:
+        stored = db._collection.get(ids=original["chunk_ids"], include=[])
+        if len(stored["ids"]) != len(original["chunk_ids"]):
+            return []
+        _link_existing_chunks(db._collection, original["chunk_ids"], document_title, text_hash)
+    return original["chunk_ids"]
+
 def process_document_and_add_to_db(document_title, text_content, text_hash, embeddings):
     """
     Processes text content, chunks it, and adds it to ChromaDB.
     This is the core function to be called on new file uploads.
+
+    Uploads that are near-duplicates of an indexed document (MinHash estimate of Jaccard
+    similarity above NEAR_DUPLICATE_THRESHOLD) are linked to the original before any chunking
+    or embedding happens. Chunks are content-addressed: a chunk that is already stored (from
+    this or any other document) is not embedded again, the document is only added to its list
+    of sources. Every ingestion is recorded in the ingestion manifest, so index maintenance can
+    find documents that failed half way. Returns a summary of what was done, or None if the
+    document had no text to index. Errors are recorded in the manifest and re-raised.
     """
+    manifest = get_ingestion_manifest()
+    document_key, started = None, False
     try:
         if not text_content.strip():
             print(f"Warning: No readable text content provided for '{document_title}'. Skipping.")
             return
 
+        # Near-duplicate check, before any chunking or embedding
+        document_key = text_hash or hashlib.sha256(text_content.encode("utf-8")).hexdigest()
+        near_duplicates = get_near_duplicate_index()
+        signature = minhash_signature(text_content)
+        match = near_duplicates.find_match(signature)
+        linked = []
+        if match and NEAR_DUPLICATE_ACTION == "link":
+            linked = _link_to_original(embeddings, match["text_hash"], document_title, text_hash)
+            if not linked:
+                print(f"'{document_title}' is a near-duplicate of '{match['title']}', but its chunks could not be resolved; indexing normally.")
+        if linked and match["text_hash"] == document_key:
+            print(f"'{document_title}' has already been indexed as '{match['title']}'; linked {len(linked)} chunks.")
+            return {
+                "status": "already_indexed",
+                "action": "linked",
+                "indexed_as": {"title": match["title"], "text_hash": match["text_hash"]},
+                "reason": "This exact document has already been indexed.",
+                "linked_chunks": len(linked),
+            }
+        if linked:
+            near_duplicates.add_duplicate(document_key, document_title, signature, match["text_hash"], match["similarity"])
+            manifest.record(document_key, text_hash, document_title, "linked", linked)
+            print(f"'{document_title}' is a near-duplicate of '{match['title']}' ({match['similarity']:.2f}); linked {len(linked)} chunks instead of indexing.")
+            return {
+                "status": "near_duplicate",
+                "action": "linked",
+                "duplicate_of": {"title": match["title"], "text_hash": match["text_hash"]},
+                "similarity": match["similarity"],
+                "reason": (
+                    f"Estimated {match['similarity']:.0%} overlap with '{match['title']}', "
+                    f"above the {near_duplicates.threshold:.0%} near-duplicate threshold."
+                ),
+                "linked_chunks": len(linked),
+            }
+
         # Create a LangChain Document with metadata
         document = Document(page_content=text_content, metadata={"source": document_title, "text_hash": text_hash})
         
@@ -51,18 +295,73 @@ def process_document_and_add_to_db(document_title, text_content, text_hash, embe
         print(f"Text extracted and split into {len(chunks)} chunks for '{document_title}'.")
         
         # Get the ChromaDB instance
-        db = get_chroma_db(embeddings)
-        if db is None:
-            # If the DB doesn't exist, create it from this first set of chunks
-            db = Chroma.from_documents(chunks, embeddings, persist_directory=CHROMA_DB_PATH)
-            print(f"New ChromaDB created with documents from '{document_title}'.")
-        else:
-            # If the DB exists, add the new documents to it
-            db.add_documents(chunks)
-            print(f"New chunks from '{document_title}' added to existing ChromaDB.")
+        with _index_writer_lock:
+            db = get_chroma_db(embeddings)
+            if db is None:
+                # If the DB doesn't exist, create it empty; the chunks are added below
+                db = Chroma(
+                    persist_directory=CHROMA_DB_PATH,
+                    embedding_function=embeddings,
+                    collection_metadata=fingerprint_metadata(embeddings),
+                )
+                print(f"New ChromaDB created for documents from '{document_title}'.")
+
+        # Content-address the chunks, dropping repeats within the document itself
+        unique = {}
+        for chunk in chunks:
+            unique.setdefault(chunk_id_for(chunk.page_content), chunk)
+        ids = list(unique)
+        collection = db._collection
+        manifest.record(document_key, text_hash, document_title, "started", ids)
+        started = True
+
+        # Link this document to chunks that are already stored; only the rest needs embedding
+        with _index_writer_lock:
+            already_stored = _link_existing_chunks(collection, ids, document_title, text_hash)
+
+        ids = [chunk_id for chunk_id in ids if chunk_id not in already_stored]
+        texts = [unique[chunk_id].page_content for chunk_id in ids]
+        metadatas = [
+            {
+                **unique[chunk_id].metadata,
+                "sources": json.dumps([document_title]),
+                "text_hashes": json.dumps([text_hash]),
+                "source_count": 1,
+            }
+            for chunk_id in ids
+        ]
+
+        # Embed in the worker pool and write each batch as soon as it comes back
+        added = 0
+        for start, vectors in get_ingestion_pool(embeddings).embed_documents(texts):
+            end = start + len(vectors)
+            with _index_writer_lock:
+                added += _write_chunks(
+                    collection, ids[start:end], texts[start:end], metadatas[start:end], vectors,
+                    document_title, text_hash,
+                )
+
+        near_duplicates.add_original(document_key, document_title, signature)
+        manifest.set_status(document_key, "complete")
+
+        summary = {
+            "status": "indexed",
+            "chunks": len(chunks),
+            "unique_chunks": len(unique),
+            "new_chunks": added,
+            "deduplicated_chunks": len(chunks) - added,
+        }
+        if match:
+            # Indexed anyway (NEAR_DUPLICATE_ACTION == "flag", or the original's chunks could not be linked), but reported
+            summary["near_duplicate_of"] = {"title": match["title"], "text_hash": match["text_hash"], "similarity": match["similarity"]}
+        print(f"'{document_title}': {added} new chunks embedded, {len(chunks) - added} already stored.")
+        return summary
             
     except Exception as e:
         print(f"An unexpected error occurred while processing '{document_title}': {e}.")
+        if started:
+            manifest.set_status(document_key, "failed", error=str(e))
+        raise
 
 if __name__ == '__main__':
     print("This file is a module to be imported. The main block is for testing.")
@@ -0,0 +1,117 @@
+import os
+import json
+
+# --- Configuration ---
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "bge-large")
+# What to do when a stored collection was embedded with another backend: "refuse" to start, or "migrate" (re-embed)
+EMBEDDING_MISMATCH_POLICY = os.getenv("EMBEDDING_MISMATCH_POLICY", "refuse")
+# Collection metadata key holding the fingerprint; Chroma metadata is flat, so the value is a JSON string
+FINGERPRINT_METADATA_KEY = "embedding_fingerprint"
+
+# runtime "torch" is sentence-transformers through LangChain; "onnx" is fastembed's ONNX Runtime models,
+# only available when fastembed is installed locally.
+EMBEDDING_BACKENDS = {
+    "bge-small": {"runtime": "torch", "model_name": "BAAI/bge-small-en-v1.5", "dim": 384},
+    "bge-base": {"runtime": "torch", "model_name": "BAAI/bge-base-en-v1.5", "dim": 768},
+    "bge-large": {"runtime": "torch", "model_name": "BAAI/bge-large-en-v1.5", "dim": 1024},
+    "bge-small-onnx": {"runtime": "onnx", "model_name": "BAAI/bge-small-en-v1.5", "dim": 384},
+    "bge-base-onnx": {"runtime": "onnx", "model_name": "BAAI/bge-base-en-v1.5", "dim": 768},
+}
+
+
+class EmbeddingMismatch(Exception):
+    """Raised when a stored collection was embedded with a different backend than the one configured."""
+
+
+def _runtime_available(runtime):
+    if runtime == "torch":
+        return True
+    try:
+        import fastembed  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def available_backends():
+    """Backend names whose runtime is installed here"""
+    return [name for name, spec in EMBEDDING_BACKENDS.items() if _runtime_available(spec["runtime"])]
+
+
+def load_embedding_backend(name=EMBEDDING_BACKEND):
+    """Builds the LangChain embeddings object for a registered backend."""
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{name}'. Registered: {', '.join(EMBEDDING_BACKENDS)}")
+    spec = EMBEDDING_BACKENDS[name]
+    if not _runtime_available(spec["runtime"]):
+        raise ValueError(f"Embedding backend '{name}' needs the fastembed package, which is not installed")
+
+    if spec["runtime"] == "onnx":
+        from langchain_community.embeddings import FastEmbedEmbeddings
+        return FastEmbedEmbeddings(model_name=spec["model_name"])
+
+    from langchain_community.embeddings import HuggingFaceBgeEmbeddings
+    return HuggingFaceBgeEmbeddings(model_name=spec["model_name"])
+
+
+def embedding_runtime(embeddings):
+    return "onnx" if type(embeddings).__name__ == "FastEmbedEmbeddings" else "torch"
+
+
+def is_fork_safe(embeddings):
+    """ONNX Runtime sessions do not survive fork, so only torch backends can use the ingestion worker pool."""
+    return embedding_runtime(embeddings) == "torch"
+
+
+def embedding_fingerprint(embeddings):
+    """Identifies the embedding model so vectors are never mixed across models."""
+    encode_kwargs = getattr(embeddings, "encode_kwargs", {}) or {}
+    return {
+        "runtime": embedding_runtime(embeddings),
+        "model_name": getattr(embeddings, "model_name", type(embeddings).__name__),
+        "query_instruction": getattr(embeddings, "query_instruction", ""),
+        "normalize_embeddings": bool(encode_kwargs.get("normalize_embeddings", False)),
+    }
+
+
+def fingerprint_metadata(embeddings):
+    """Collection metadata recording which embedding model the collection's vectors come from"""
+    return {FINGERPRINT_METADATA_KEY: json.dumps(embedding_fingerprint(embeddings), sort_keys=True)}
+
+
+def collection_fingerprint(collection):
+    """The fingerprint stored on a collection, or None for collections created before fingerprints existed"""
+    value = (collection.metadata or {}).get(FINGERPRINT_METADATA_KEY)
+    return json.loads(value) if value else None
+
+
+def stored_dimension(collection):
+    """Vector dimension of a collection, or None if it is empty"""
+    sample = collection.get(limit=1, include=["embeddings"])
+    if not sample["ids"]:
+        return None
+    return len(sample["embeddings"][0])
+
+
+def stamp_collection(collection, embeddings):
+    """Records the embedding fingerprint on an existing collection, keeping its other metadata"""
+    # Chroma rejects hnsw:* keys on modify, and modify replaces the whole metadata dict
+    metadata = {key: value for key, value in (collection.metadata or {}).items() if not key.startswith("hnsw:")}
+    metadata.update(fingerprint_metadata(embeddings))
+    collection.modify(metadata=metadata)
+
+
+def check_collection(collection, embeddings):
+    """
+    Compares a collection with the configured embeddings. Returns "match" or "mismatch".
+    Collections without a fingerprint are adopted (stamped) when their vector dimension fits.
+    """
+    stored = collection_fingerprint(collection)
+    if stored is not None:
+        return "match" if stored == embedding_fingerprint(embeddings) else "mismatch"
+
+    dimension = stored_dimension(collection)
+    if dimension is not None and dimension != len(embeddings.embed_query("dimension check")):
+        return "mismatch"
+    stamp_collection(collection, embeddings)
+    return "match"
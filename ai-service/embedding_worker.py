@@ -0,0 +1,179 @@
+import os
+import time
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from embedding_backends import is_fork_safe, embedding_fingerprint
+
+# --- Configuration ---
+# Worker processes for ingestion embeddings; 0 embeds in the calling thread.
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "2"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+
+# Set in each worker process by _init_worker
+_worker_embeddings = None
+
+
+def _init_worker(embeddings):
+    global _worker_embeddings
+    # Workers are forked, so the model loaded by the parent is shared copy-on-write instead of reloaded.
+    _worker_embeddings = embeddings
+    try:
+        import torch
+        # One intra-op thread per worker keeps the pool size the bound on ingestion CPU use
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def _embed_batch(start, texts):
+    started = time.perf_counter()
+    vectors = _worker_embeddings.embed_documents(texts)
+    return start, vectors, time.perf_counter() - started
+
+
+class UtilisationMeter:
+    """Tracks in-flight work and busy time for one embedding path."""
+
+    def __init__(self, name, capacity):
+        self.name = name
+        self.capacity = max(capacity, 1)
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._items = 0
+        self._busy_seconds = 0.0
+
+    def begin(self):
+        with self._lock:
+            self._in_flight += 1
+
+    def end(self, items, seconds, failed=False):
+        with self._lock:
+            self._in_flight -= 1
+            if failed:
+                self._failed += 1
+            else:
+                self._completed += 1
+                self._items += items
+                self._busy_seconds += seconds
+
+    @contextmanager
+    def track(self, items):
+        self.begin()
+        started = time.perf_counter()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            self.end(items, time.perf_counter() - started, failed=failed)
+
+    def stats(self):
+        with self._lock:
+            elapsed = max(time.monotonic() - self._started_at, 1e-9)
+            return {
+                "capacity": self.capacity,
+                "in_flight": self._in_flight,
+                "completed_batches": self._completed,
+                "failed_batches": self._failed,
+                "embedded_texts": self._items,
+                "busy_seconds": round(self._busy_seconds, 3),
+                # Lifetime average share of capacity spent embedding
+                "utilisation": round(self._busy_seconds / (elapsed * self.capacity), 4),
+            }
+
+
+# Query-time embeddings run on the request thread in this process; ingestion never uses this path.
+query_meter = UtilisationMeter("query", capacity=1)
+
+
+class IngestionEmbeddingPool:
+    """Embeds ingestion batches in worker processes so they never hold the serving process's GIL or cores."""
+
+    def __init__(self, embeddings, workers=EMBED_WORKERS, batch_size=EMBED_BATCH_SIZE):
+        self.embeddings = embeddings
+        self.batch_size = max(batch_size, 1)
+        self.workers = workers
+        self._executor = None
+
+        if workers > 0 and is_fork_safe(embeddings) and "fork" in multiprocessing.get_all_start_methods():
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=_init_worker,
+                initargs=(embeddings,),
+            )
+            # Fork every worker now, during startup, rather than from a busy request thread later
+            pids = {self._executor.submit(_warm_up).result() for _ in range(workers)}
+            print(f"✅ Ingestion embedding pool started ({workers} workers, batch size {self.batch_size}, pids {sorted(pids)})")
+        else:
+            self.workers = 0
+            print("⚠️ Ingestion embedding pool disabled, embedding in the calling thread")
+
+        self.meter = UtilisationMeter("ingestion", capacity=self.workers or 1)
+
+    def _account(self, batch_size):
+        def done(future):
+            if future.cancelled() or future.exception() is not None:
+                self.meter.end(0, 0.0, failed=True)
+            else:
+                _, _, seconds = future.result()
+                self.meter.end(batch_size, seconds)
+        return done
+
+    def embed_documents(self, texts):
+        """Yields (start_index, vectors) for each batch as soon as it is embedded; batches may arrive out of order."""
+        batches = [(start, texts[start:start + self.batch_size]) for start in range(0, len(texts), self.batch_size)]
+
+        if self._executor is None:
+            for start, batch in batches:
+                with self.meter.track(len(batch)):
+                    vectors = self.embeddings.embed_documents(batch)
+                yield start, vectors
+            return
+
+        futures = []
+        for start, batch in batches:
+            self.meter.begin()
+            future = self._executor.submit(_embed_batch, start, batch)
+            future.add_done_callback(self._account(len(batch)))
+            futures.append(future)
+
+        try:
+            for future in as_completed(futures):
+                start, vectors, _ = future.result()
+                yield start, vectors
+        finally:
+            # If the caller stops early or a batch fails, drop the batches that have not started
+            for future in futures:
+                future.cancel()
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "batch_size": self.batch_size,
+            "model": embedding_fingerprint(self.embeddings),
+            **self.meter.stats(),
+        }
+
+
+_ingestion_pool = None
+_ingestion_pool_lock = threading.Lock()
+
+
+def get_ingestion_pool(embeddings):
+    """Returns the process-wide ingestion embedding pool, starting it on first use."""
+    global _ingestion_pool
+    with _ingestion_pool_lock:
+        if _ingestion_pool is None:
+            _ingestion_pool = IngestionEmbeddingPool(embeddings)
+        return _ingestion_pool
@@ -0,0 +1,137 @@
+"""
+Compares embedding backends on the local corpus.
+
+For every backend it embeds a sample of the stored chunks and reports document throughput,
+per-query latency (query embedding plus an exact search over the sample) and recall@k.
+Queries are sentences taken from sampled chunks, and each one should find its own chunk.
+A JSONL file of labelled queries ({"query": ..., "chunk_ids": [...]}) can be added with --labelled.
+
+    python evaluate_embeddings.py --backends bge-small bge-base bge-large --chunks 500 --queries 100 --k 5
+"""
+import re
+import json
+import time
+import random
+import argparse
+import numpy as np
+from langchain_community.vectorstores import Chroma
+
+from create import CHROMA_DB_PATH
+from embedding_backends import available_backends, load_embedding_backend
+from retrieval import embed_queries
+
+EMBED_BATCH_SIZE = 32
+
+
+def load_corpus(limit, seed):
+    """A random sample of (chunk_id, text) from the user documents ChromaDB"""
+    collection = Chroma(persist_directory=CHROMA_DB_PATH)._collection
+    stored = collection.get(include=["documents"])
+    corpus = list(zip(stored["ids"], stored["documents"]))
+    random.Random(seed).shuffle(corpus)
+    return corpus[:limit]
+
+
+def known_item_queries(corpus, limit, seed):
+    """One sentence of 8-40 words per sampled chunk, relevant to every chunk that contains it"""
+    rng = random.Random(seed)
+    queries = []
+    for _, text in rng.sample(corpus, len(corpus)):
+        sentences = [s.strip() for s in re.split(r"(?<=[.?!])\s+", text) if 8 <= len(s.split()) <= 40]
+        if not sentences:
+            continue
+        sentence = rng.choice(sentences)
+        relevant = {chunk_id for chunk_id, other in corpus if sentence in other}
+        queries.append((sentence, relevant))
+        if len(queries) >= limit:
+            break
+    return queries
+
+
+def load_labelled_queries(path, corpus):
+    """Labelled queries whose relevant chunks are in the sample"""
+    sampled = {chunk_id for chunk_id, _ in corpus}
+    queries = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                relevant = set(item["chunk_ids"]) & sampled
+                if relevant:
+                    queries.append((item["query"], relevant))
+    return queries
+
+
+def evaluate_backend(name, corpus, queries, k):
+    started = time.perf_counter()
+    embeddings = load_embedding_backend(name)
+    load_seconds = time.perf_counter() - started
+
+    texts = [text for _, text in corpus]
+    ids = [chunk_id for chunk_id, _ in corpus]
+    embeddings.embed_documents(texts[:1])  # warm-up
+    started = time.perf_counter()
+    vectors = []
+    for start in range(0, len(texts), EMBED_BATCH_SIZE):
+        vectors.extend(embeddings.embed_documents(texts[start:start + EMBED_BATCH_SIZE]))
+    embed_seconds = time.perf_counter() - started
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+
+    latencies, hits = [], 0
+    for query, relevant in queries:
+        started = time.perf_counter()
+        vector = np.asarray(embed_queries(embeddings, [query])[0], dtype=np.float32)
+        top = np.argsort(-(matrix @ vector))[:k]
+        latencies.append(time.perf_counter() - started)
+        hits += bool(relevant & {ids[i] for i in top})
+
+    return {
+        "backend": name,
+        "dim": int(matrix.shape[1]),
+        "load_seconds": round(load_seconds, 2),
+        "embed_docs_per_second": round(len(texts) / embed_seconds, 1),
+        "query_p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 1) if latencies else None,
+        "query_p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 1) if latencies else None,
+        f"recall@{k}": round(hits / len(queries), 3) if queries else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding backends on the local corpus")
+    parser.add_argument("--backends", nargs="+", default=available_backends())
+    parser.add_argument("--chunks", type=int, default=500, help="chunks sampled from the corpus")
+    parser.add_argument("--queries", type=int, default=100, help="known-item queries drawn from the sample")
+    parser.add_argument("--labelled", help="JSONL file of labelled queries")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.chunks, args.seed)
+    if not corpus:
+        print(f"No chunks found in {CHROMA_DB_PATH}; ingest some documents first.")
+        return
+    queries = known_item_queries(corpus, args.queries, args.seed)
+    if args.labelled:
+        queries += load_labelled_queries(args.labelled, corpus)
+    print(f"Evaluating {len(args.backends)} backends on {len(corpus)} chunks and {len(queries)} queries\n")
+
+    results = []
+    for name in args.backends:
+        try:
+            result = evaluate_backend(name, corpus, queries, args.k)
+        except Exception as e:
+            print(f"❌ {name}: {e}")
+            continue
+        results.append(result)
+        print(json.dumps(result))
+
+    if results:
+        columns = list(results[0])
+        print("\n" + " | ".join(columns))
+        for result in results:
+            print(" | ".join(str(result[column]) for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+from retrieval import embed_queries
+
+# --- Configuration ---
+FAQ_CACHE_PATH = "./faq_cache.json"
+FAQ_MATCH_THRESHOLD = float(os.getenv("FAQ_MATCH_THRESHOLD", "0.92"))
+# Bumped whenever the way answers are generated changes, so older cached tables are rebuilt
+FAQ_TABLE_VERSION = 2
+
+# Curated platform questions whose answers are pre-generated from the system knowledge.
+CURATED_PLATFORM_QUESTIONS = [
+    "What is Scholara Collective?",
+    "What is this site about?",
+    "Why was Scholara Collective created?",
+    "Is Scholara Collective free to use?",
+    "What features does Scholara Collective offer?",
+    "How do I upload a resource?",
+    "What file types can I upload and how big can they be?",
+    "How do I search for resources on the site?",
+    "How do I download resources?",
+    "Can I download resources without an account?",
+    "How do I rate or comment on a resource?",
+    "How do I report low-quality or inappropriate content?",
+    "Which languages does the platform support?",
+    "What technology is Scholara Collective built with?",
+    "How does Scholara Collective keep my data private and secure?",
+    "How can I get help or contact support?",
+    "Is Scholara Collective open source?",
+    "How can I contribute to Scholara Collective?",
+]
+
+
+def knowledge_fingerprint(knowledge, questions, model_names):
+    """Hash of everything a cached answer depends on, so the table is rebuilt only when one of them changes."""
+    payload = json.dumps(
+        {"version": FAQ_TABLE_VERSION, "knowledge": knowledge, "questions": questions, "models": model_names},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class FAQAnswerTable:
+    """Pre-generated answers for curated platform questions, matched by embedding similarity."""
+
+    def __init__(self, embeddings, threshold=FAQ_MATCH_THRESHOLD, cache_path=FAQ_CACHE_PATH):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.cache_path = cache_path
+        self.entries = []
+        self.matrix = None
+
+    def _set_entries(self, entries):
+        self.entries = entries
+        if entries:
+            matrix = np.array([entry["embedding"] for entry in entries], dtype=np.float32)
+            self.matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+        else:
+            self.matrix = None
+
+    def _load(self, fingerprint):
+        if not os.path.exists(self.cache_path):
+            return False
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read FAQ cache, rebuilding: {e}")
+            return False
+        if cached.get("fingerprint") != fingerprint:
+            print("🔄 Scholara knowledge changed, rebuilding FAQ answer table")
+            return False
+        self._set_entries(cached.get("entries", []))
+        return True
+
+    def load_or_build(self, knowledge, answer_fn, questions=CURATED_PLATFORM_QUESTIONS, model_names=()):
+        """
+        Loads the cached table if it was built from the same knowledge, questions and models;
+        otherwise generates every answer with answer_fn(question, question_vector) and persists the result.
+        answer_fn must return a dict with "answer", "source_documents" and "chunk_ids".
+        """
+        fingerprint = knowledge_fingerprint(knowledge, list(questions), list(model_names))
+        if self._load(fingerprint):
+            print(f"✅ Loaded {len(self.entries)} pre-generated FAQ answers")
+            return
+
+        vectors = embed_queries(self.embeddings, list(questions))
+        entries = []
+        for question, vector in zip(questions, vectors):
+            try:
+                generated = answer_fn(question, vector)
+            except Exception as e:
+                print(f"❌ Error generating FAQ answer for '{question}': {e}")
+                continue
+            entries.append({
+                "question": question,
+                "answer": generated["answer"],
+                "source_documents": generated["source_documents"],
+                "chunk_ids": generated["chunk_ids"],
+                "embedding": [float(x) for x in vector],
+            })
+        self._set_entries(entries)
+
+        # Only persist a complete table so a partial build is retried on the next start
+        if len(entries) == len(questions):
+            with open(self.cache_path, "w", encoding="utf-8") as f:
+                json.dump({"fingerprint": fingerprint, "entries": entries}, f)
+            print(f"✅ Built FAQ answer table with {len(entries)} answers")
+        else:
+            print(f"⚠️ FAQ answer table incomplete ({len(entries)}/{len(questions)}), not persisted")
+
+    def match_vector(self, query_vector):
+        """Returns (entry, similarity) for the closest question above threshold, else (None, best_similarity)."""
+        if self.matrix is None:
+            return None, 0.0
+        vector = np.asarray(query_vector, dtype=np.float32)
+        vector = vector / np.linalg.norm(vector)
+        similarities = self.matrix @ vector
+        best = int(np.argmax(similarities))
+        similarity = float(similarities[best])
+        if similarity >= self.threshold:
+            return self.entries[best], similarity
+        return None, similarity
+
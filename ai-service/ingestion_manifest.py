@@ -0,0 +1,98 @@
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# --- Configuration ---
+INGESTION_MANIFEST_PATH = "./ingestion_manifest.sqlite3"
+
+# started:     chunks are being written; left behind if the process died or the write failed silently
+# failed:      ingestion raised; some chunks may have been written
+# complete:    every chunk was written or linked
+# linked:      near-duplicate upload, attached to the original's chunks instead of indexed
+# rolled_back: a started/failed ingestion whose chunks maintenance removed
+# removed:     the document is no longer known to the platform and its chunks were removed
+
+
+class IngestionManifest:
+    """Records, per document, which chunks its ingestion should have produced and whether it finished."""
+
+    def __init__(self, path=INGESTION_MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " document_key TEXT PRIMARY KEY, text_hash TEXT, title TEXT, status TEXT,"
+                " chunk_ids TEXT, error TEXT, updated_at REAL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def record(self, document_key, text_hash, title, status, chunk_ids):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (document_key, text_hash, title, status, chunk_ids, error, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, NULL, ?)",
+                (document_key, text_hash, title, status, json.dumps(list(chunk_ids)), time.time()),
+            )
+
+    def set_status(self, document_key, status, error=None):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE documents SET status = ?, error = ?, updated_at = ? WHERE document_key = ?",
+                (status, error, time.time(), document_key),
+            )
+
+    def get(self, document_key):
+        """The manifest entry of one document as a dict, or None"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT document_key, text_hash, title, status, chunk_ids, error, updated_at FROM documents WHERE document_key = ?",
+                (document_key,),
+            ).fetchone()
+        if row is None:
+            return None
+        key, text_hash, title, status, chunk_ids, error, updated_at = row
+        return {
+            "document_key": key, "text_hash": text_hash, "title": title, "status": status,
+            "chunk_ids": json.loads(chunk_ids or "[]"), "error": error, "updated_at": updated_at,
+        }
+
+    def documents(self, statuses=None):
+        """Manifest entries as dicts, optionally only those with the given statuses"""
+        query = "SELECT document_key, text_hash, title, status, chunk_ids, error, updated_at FROM documents"
+        params = []
+        if statuses:
+            query += f" WHERE status IN ({','.join('?' * len(statuses))})"
+            params = list(statuses)
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [
+            {
+                "document_key": key, "text_hash": text_hash, "title": title, "status": status,
+                "chunk_ids": json.loads(chunk_ids or "[]"), "error": error, "updated_at": updated_at,
+            }
+            for key, text_hash, title, status, chunk_ids, error, updated_at in rows
+        ]
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def get_ingestion_manifest():
+    """Returns the process-wide ingestion manifest, opening it on first use."""
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = IngestionManifest()
+        return _manifest
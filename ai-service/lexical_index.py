@@ -0,0 +1,178 @@
+import os
+import re
+import math
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from contextlib import contextmanager
+
+# --- Configuration ---
+LEXICAL_INDEX_PATH = "./lexical_index.sqlite3"
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+SYNC_PAGE_SIZE = 1000
+# Queries up to this many terms that contain a letter-digit code (PYQ 2019 Q4b, CS101) are exact-term lookups
+EXACT_TERM_MAX_TERMS = 8
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "is", "it", "of",
+    "on", "or", "that", "the", "this", "to", "was", "what", "when", "where", "which", "who", "why", "with",
+}
+
+
+def tokenize(text):
+    """Lowercased word tokens; course codes and question numbers (q4b, cs101, 2019) stay whole."""
+    return [
+        token for token in re.findall(r"\w+", unicodedata.normalize("NFKC", text).casefold())
+        if token not in STOPWORDS
+    ]
+
+
+def _is_code(token):
+    """Course codes and question numbers mix letters and digits: cs101, q4b, 2019a"""
+    return any(ch.isdigit() for ch in token) and any(ch.isalpha() for ch in token)
+
+
+def _is_year(token):
+    return len(token) == 4 and token.isdigit() and token[:2] in ("19", "20")
+
+
+def exact_terms(query):
+    """
+    The code-like terms of an exact-term query, or [] if the query should go through dense retrieval.
+    Only real code shapes count; a year counts alongside a code (PYQ 2019 Q4b), bare numbers never do.
+    """
+    tokens = list(dict.fromkeys(tokenize(query)))
+    if not tokens or len(tokens) > EXACT_TERM_MAX_TERMS:
+        return []
+    codes = [token for token in tokens if _is_code(token)]
+    if not codes:
+        return []
+    return [token for token in tokens if token in codes or _is_year(token)]
+
+
+class LexicalIndex:
+    """Incrementally maintained BM25 inverted index over the user document chunks, keyed by chunk id."""
+
+    def __init__(self, path=LEXICAL_INDEX_PATH, k1=BM25_K1, b=BM25_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS chunks (chunk_id TEXT PRIMARY KEY, length INTEGER)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS postings ("
+                " term TEXT, chunk_id TEXT, tf INTEGER, PRIMARY KEY (term, chunk_id)) WITHOUT ROWID"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def count(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def add_chunks(self, ids, texts):
+        """Indexes chunks that are not indexed yet. Returns how many were added."""
+        with self._lock, self._connect() as conn:
+            placeholders = ",".join("?" * len(ids))
+            indexed = {row[0] for row in conn.execute(f"SELECT chunk_id FROM chunks WHERE chunk_id IN ({placeholders})", ids)} if ids else set()
+            rows, postings = [], []
+            for chunk_id, text in zip(ids, texts):
+                if chunk_id in indexed:
+                    continue
+                indexed.add(chunk_id)
+                counts = Counter(tokenize(text or ""))
+                rows.append((chunk_id, sum(counts.values())))
+                postings.extend((term, chunk_id, tf) for term, tf in counts.items())
+            conn.executemany("INSERT INTO chunks (chunk_id, length) VALUES (?, ?)", rows)
+            conn.executemany("INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)", postings)
+            return len(rows)
+
+    def remove_chunks(self, ids):
+        """Drops chunks from the index, e.g. after index maintenance deleted them from the collection."""
+        if not ids:
+            return
+        with self._lock, self._connect() as conn:
+            placeholders = ",".join("?" * len(ids))
+            conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({placeholders})", ids)
+            conn.execute(f"DELETE FROM chunks WHERE chunk_id IN ({placeholders})", ids)
+
+    def sync(self, collection):
+        """Indexes any chunks of a collection that are missing, e.g. ones stored before the lexical index existed."""
+        if self.count() >= collection.count():
+            return 0
+        added, offset = 0, 0
+        while True:
+            page = collection.get(include=["documents"], limit=SYNC_PAGE_SIZE, offset=offset)
+            if not page["ids"]:
+                break
+            added += self.add_chunks(page["ids"], page["documents"])
+            offset += len(page["ids"])
+        return added
+
+    def copy_to(self, path):
+        """Writes a consistent copy of the index to path, e.g. to bundle it into an index snapshot."""
+        with self._lock, self._connect() as conn:
+            target = sqlite3.connect(path)
+            try:
+                conn.backup(target)
+            finally:
+                target.close()
+
+    def search(self, query, k=5, required_terms=()):
+        """
+        BM25 ranking for a query. Returns (chunk_id, score) best first; with required_terms,
+        only chunks containing every one of them are returned.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        placeholders = ",".join("?" * len(terms))
+        with self._connect() as conn:
+            total, average_length = conn.execute("SELECT COUNT(*), AVG(length) FROM chunks").fetchone()
+            if not total:
+                return []
+            document_frequency = dict(conn.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term", terms
+            ))
+            rows = conn.execute(
+                f"SELECT p.term, p.chunk_id, p.tf, c.length FROM postings p JOIN chunks c ON c.chunk_id = p.chunk_id"
+                f" WHERE p.term IN ({placeholders})", terms
+            ).fetchall()
+
+        scores, matched = {}, {}
+        for term, chunk_id, tf, length in rows:
+            df = document_frequency[term]
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * length / (average_length or 1))
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            matched.setdefault(chunk_id, set()).add(term)
+
+        required = set(required_terms)
+        ranked = sorted(
+            (chunk_id for chunk_id in scores if required <= matched[chunk_id]),
+            key=scores.get, reverse=True,
+        )
+        return [(chunk_id, scores[chunk_id]) for chunk_id in ranked[:k]]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_lexical_index():
+    """Returns the process-wide lexical index, opening it on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = LexicalIndex()
+        return _index
@@ -4,25 +4,39 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 from langchain_groq import ChatGroq
-import hashlib
 
 # Add parent dir for create.py
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 # Import helpers
-from create import process_document_and_add_to_db, get_chroma_db
+from create import process_document_and_add_to_db, get_chroma_db, verify_chroma_db, CHROMA_DB_PATH, _index_writer_lock
+from retrieval import embed_queries, scored_search, fetch_by_ids, lexical_search, hybrid_search, reciprocal_rank_fusion
+from lexical_index import get_lexical_index, exact_terms, LEXICAL_INDEX_PATH
+from search_policy import SearchPolicy, search_metrics
+from session_store import SessionStore, is_follow_up_query
+from query_flow import CpuStep, ChatStep, run_flow
+from faq_cache import FAQAnswerTable, FAQ_CACHE_PATH
+from admission import AdmissionController, AdmissionRejected
+from maintenance import MaintenanceRunner
+from embedding_worker import get_ingestion_pool, query_meter
+from embedding_backends import (
+    load_embedding_backend, check_collection, fingerprint_metadata, EmbeddingMismatch, EMBEDDING_BACKEND,
+)
+from snapshot import (
+    load_snapshot, export_snapshot, import_snapshot_collection, restore_snapshot_files, SnapshotError, INDEX_SNAPSHOT_PATH,
+)
 
 # LangChain imports
 from langchain_core.prompts import PromptTemplate
-from langchain_community.embeddings import HuggingFaceBgeEmbeddings
 from langchain_community.vectorstores import Chroma
 
 # Load env vars
 load_dotenv()
 
 # Flask setup
+CORS_ORIGINS = ["https://scholara-collective.onrender.com", "http://localhost:5173"]
 app = Flask(__name__)
-CORS(app, origins=["https://scholara-collective.onrender.com", "http://localhost:5173"])
+CORS(app, origins=CORS_ORIGINS)
 
 # ✅ Use LangChain's Groq wrapper directly
 chat_model = ChatGroq(
@@ -33,9 +47,9 @@ chat_model = ChatGroq(
 
 # Load embeddings
 try:
-    embeddings = HuggingFaceBgeEmbeddings(model_name="BAAI/bge-large-en-v1.5")
+    embeddings = load_embedding_backend(EMBEDDING_BACKEND)
     
-    print("✅ Embeddings model loaded successfully.")
+    print(f"✅ Embeddings model loaded successfully ({EMBEDDING_BACKEND}).")
 except Exception as e:
     print(f"❌ Error loading embeddings model: {e}")
     sys.exit()
@@ -44,31 +58,20 @@ except Exception as e:
 # -------------------------------
 # Scholara Knowledge Manager
 # -------------------------------
-class ScholaraKnowledgeManager:
-    def __init__(self, embeddings, chat_model):
-        self.embeddings = embeddings
-        self.chat_model = chat_model
-        self.system_db = None
-        self.user_docs_db = None
-        
-        # Initialize system knowledge
-        self.setup_scholara_knowledge()
-    
-    def setup_scholara_knowledge(self):
-        """Create permanent system knowledge base for Scholara Collective"""
-        
-        scholara_knowledge = [
-            {
-                "id": "what_is_scholara",
-                "content": """Scholara Collective is a free, open-source academic resource sharing platform built with the MERN stack (MongoDB, Express.js, React, Node.js). It's designed to empower students by providing organized access to educational materials like class notes, previous year question papers, model answers, revision sheets, and important questions. The platform promotes collaborative learning through community-driven contributions, ratings, and discussions, ensuring high-quality, accessible resources for students globally."""
-            },
-            {
-                "id": "platform_purpose",
-                "content": """Scholara Collective addresses the challenge students face in accessing high-quality, organized academic materials, particularly those in resource-constrained environments. Many existing platforms are expensive, disorganized, or lack community engagement. Our platform provides a centralized, free solution that promotes collaboration, accessibility, and efficient resource organization, reducing barriers to education and reliance on costly or scattered study materials."""
-            },
-            {
-                "id": "key_features",
-                "content": """Scholara Collective offers comprehensive features for academic resource sharing:
+
+# Static platform knowledge used to build the system knowledge base
+SCHOLARA_KNOWLEDGE = [
+    {
+        "id": "what_is_scholara",
+        "content": """Scholara Collective is a free, open-source academic resource sharing platform built with the MERN stack (MongoDB, Express.js, React, Node.js). It's designed to empower students by providing organized access to educational materials like class notes, previous year question papers, model answers, revision sheets, and important questions. The platform promotes collaborative learning through community-driven contributions, ratings, and discussions, ensuring high-quality, accessible resources for students globally."""
+    },
+    {
+        "id": "platform_purpose",
+        "content": """Scholara Collective addresses the challenge students face in accessing high-quality, organized academic materials, particularly those in resource-constrained environments. Many existing platforms are expensive, disorganized, or lack community engagement. Our platform provides a centralized, free solution that promotes collaboration, accessibility, and efficient resource organization, reducing barriers to education and reliance on costly or scattered study materials."""
+    },
+    {
+        "id": "key_features",
+        "content": """Scholara Collective offers comprehensive features for academic resource sharing:
 
 1. User Authentication: Signup/login with email or Google OAuth, plus guest access for downloads with admin moderation
 2. Resource Management: Upload PDFs, images, and text documents with rich metadata (subject, course, year, institution, tags)
@@ -80,10 +83,10 @@ class ScholaraKnowledgeManager:
 8. Analytics Dashboard: Track your upload/download history and view platform usage insights with chart.js
 9. AI Chatbot: Get intelligent answers about uploaded documents and general academic questions
 10. Privacy & Security: Encrypted data storage, user-controlled resource visibility, GDPR-compliant data deletion"""
-            },
-            {
-                "id": "how_to_upload",
-                "content": """To upload and share resources on Scholara Collective:
+    },
+    {
+        "id": "how_to_upload",
+        "content": """To upload and share resources on Scholara Collective:
 
 1. Create an account or login (Google OAuth available for quick access)
 2. Navigate to the Upload section or click the 'Upload Resource' button
@@ -99,10 +102,10 @@ class ScholaraKnowledgeManager:
 7. Click 'Upload' to process and share with the community
 
 Your uploads contribute to the collaborative learning ecosystem and help fellow students access quality educational materials."""
-            },
-            {
-                "id": "how_to_download_and_search",
-                "content": """Finding and downloading resources on Scholara Collective:
+    },
+    {
+        "id": "how_to_download_and_search",
+        "content": """Finding and downloading resources on Scholara Collective:
 
 SEARCHING:
 - Use the main search bar for keyword-based searches across all content
@@ -120,10 +123,10 @@ DOWNLOADING:
 6. Save useful resources to your personal library for quick future access
 
 All downloads are completely free and support the academic community's collaborative learning goals."""
-            },
-            {
-                "id": "community_and_quality",
-                "content": """Scholara Collective's community-driven quality system:
+    },
+    {
+        "id": "community_and_quality",
+        "content": """Scholara Collective's community-driven quality system:
 
 COMMUNITY FEATURES:
 - Rate resources (1-5 stars) based on quality and usefulness
@@ -146,10 +149,10 @@ GUIDELINES:
 - Provide fair and constructive ratings and reviews
 - Report spam, inappropriate, or copyright-violating content
 - Maintain a respectful, supportive learning environment"""
-            },
-            {
-                "id": "technical_and_accessibility",
-                "content": """Scholara Collective technical features and accessibility:
+    },
+    {
+        "id": "technical_and_accessibility",
+        "content": """Scholara Collective technical features and accessibility:
 
 TECHNICAL STACK:
 - Frontend: React with responsive Tailwind CSS design
@@ -175,10 +178,10 @@ SECURITY:
 - Validated file uploads with security scanning
 - Regular security updates and monitoring
 - User-controlled privacy settings and data management"""
-            },
-            {
-                "id": "getting_help_and_support",
-                "content": """Getting help and support on Scholara Collective:
+    },
+    {
+        "id": "getting_help_and_support",
+        "content": """Getting help and support on Scholara Collective:
 
 IMMEDIATE HELP:
 1. AI Chatbot: Use our intelligent chatbot for instant answers about platform features, how-to questions, and academic topics
@@ -201,10 +204,10 @@ STAYING UPDATED:
 - Join our mailing list for important announcements and feature updates
 
 Our goal is to ensure every student can successfully use Scholara Collective to enhance their learning experience."""
-            },
-            {
-                "id": "open_source_and_contribution",
-                "content": """Scholara Collective as an open-source educational platform:
+    },
+    {
+        "id": "open_source_and_contribution",
+        "content": """Scholara Collective as an open-source educational platform:
 
 OPEN SOURCE COMMITMENT:
 - Complete source code available on GitHub under open-source license
@@ -227,8 +230,25 @@ DEVELOPMENT IMPACT:
 - Collaborative Learning: Work with international developers on meaningful educational technology
 
 The platform's open-source nature ensures it remains free, continuously improved, and accessible to students worldwide regardless of economic circumstances."""
-            }
-        ]
+    }
+]
+
+
+class ScholaraKnowledgeManager:
+    def __init__(self, embeddings, chat_model, snapshot=None):
+        self.embeddings = embeddings
+        self.chat_model = chat_model
+        self.snapshot = snapshot or {}
+        self.system_db = None
+        self.user_docs_db = None
+        self.search_policy = SearchPolicy()
+        self.lexical_index = get_lexical_index()
+        
+        # Initialize system knowledge
+        self.setup_scholara_knowledge()
+    
+    def setup_scholara_knowledge(self):
+        """Create permanent system knowledge base for Scholara Collective"""
         
         # Create or load system knowledge database
         try:
@@ -241,13 +261,24 @@ The platform's open-source nature ensures it remains free, continuously improved
                     persist_directory=system_persist_dir,
                     embedding_function=self.embeddings
                 )
-                print("✅ Loaded existing Scholara system knowledge")
-            else:
+                if check_collection(self.system_db._collection, self.embeddings) == "mismatch":
+                    # System knowledge is built from SCHOLARA_KNOWLEDGE, so rebuild it rather than refuse
+                    print("🔄 System knowledge was embedded with another backend, rebuilding it")
+                    self.system_db.delete_collection()
+                    self.system_db = None
+                else:
+                    print("✅ Loaded existing Scholara system knowledge")
+            
+            if self.system_db is None and self.snapshot.get("system_knowledge"):
+                # Fresh node: serve the memory-mapped snapshot instead of re-embedding
+                self.system_db = self.snapshot["system_knowledge"]
+                print("✅ Using Scholara system knowledge from index snapshot")
+            elif self.system_db is None:
                 # Create new system knowledge base
                 documents = []
                 metadatas = []
                 
-                for item in scholara_knowledge:
+                for item in SCHOLARA_KNOWLEDGE:
                     documents.append(item["content"])
                     metadatas.append({
                         "source": f"scholara_system_{item['id']}",
@@ -260,7 +291,8 @@ The platform's open-source nature ensures it remains free, continuously improved
                     documents,
                     self.embeddings,
                     metadatas=metadatas,
-                    persist_directory=system_persist_dir
+                    persist_directory=system_persist_dir,
+                    collection_metadata=fingerprint_metadata(self.embeddings)
                 )
                 self.system_db.persist()
                 print("✅ Created Scholara system knowledge base with comprehensive platform information")
@@ -268,29 +300,34 @@ The platform's open-source nature ensures it remains free, continuously improved
         except Exception as e:
             print(f"❌ Error setting up system knowledge: {e}")
 
-    def search_system_knowledge(self, query, k=3):
-        """Search Scholara system knowledge"""
-        if not self.system_db:
+    def collection_store(self, name):
+        """The store behind a collection name used by the search policy"""
+        return self.system_db if name == "system" else self.user_docs_db
+
+    def search_by_vector(self, name, vector, k=3):
+        """Search one collection with an embedded query, returning (chunk_id, doc, similarity)"""
+        store = self.collection_store(name)
+        if not store:
             return []
         
         try:
-            docs = self.system_db.similarity_search(query, k=k)
-            return docs
+            return scored_search(store, vector, k=k)
         except Exception as e:
-            print(f"❌ Error searching system knowledge: {e}")
+            label = "system knowledge" if name == "system" else "user documents"
+            print(f"❌ Error searching {label}: {e}")
             return []
 
-    def search_user_documents(self, query, k=3):
-        """Search user-uploaded documents"""
-        if not self.user_docs_db:
+    def search_system_knowledge_with_scores(self, query, k=3):
+        """Search Scholara system knowledge, returning (chunk_id, doc, similarity)"""
+        if not self.system_db:
             return []
-        
-        try:
-            docs = self.user_docs_db.similarity_search(query, k=k)
-            return docs
-        except Exception as e:
-            print(f"❌ Error searching user documents: {e}")
+        return self.search_by_vector("system", embed_queries(self.embeddings, [query])[0], k=k)
+
+    def search_user_documents_with_scores(self, query, k=3):
+        """Search user-uploaded documents, returning (chunk_id, doc, similarity)"""
+        if not self.user_docs_db:
             return []
+        return self.search_by_vector("user", embed_queries(self.embeddings, [query])[0], k=k)
 
     def is_platform_related_query(self, query):
         """Determine if query is about Scholara platform itself"""
@@ -305,28 +342,70 @@ The platform's open-source nature ensures it remains free, continuously improved
         query_lower = query.lower()
         return any(keyword in query_lower for keyword in platform_keywords)
 
-    def get_comprehensive_response(self, query):
-        """Get response combining system knowledge and user documents"""
+    def search_collections(self, query, platform_first=False, vector=None):
+        """
+        Search system knowledge and user documents with one query embedding (the caller's
+        vector when it already has one, else embedded on first use), skipping the
+        second collection when the first already has a decisive hit. User document hits are
+        fused with the lexical (BM25) ranking. Returns the hits that score above the relevance
+        threshold as {"system": [...], "user": [...]}.
+        """
+        limits = {"system": 2, "user": 3}
+        hits = {"system": [], "user": []}
+        searched, skipped = [], []
         
-        # Check if it's a platform-related query
-        is_platform_query = self.is_platform_related_query(query)
+        # Exact-term queries (course codes, question numbers) are answered from the lexical index alone
+        # Platform questions always go through system knowledge and the relevance threshold
+        required = [] if platform_first else exact_terms(query)
+        if required and self.user_docs_db:
+            lexical_hits = lexical_search(self.user_docs_db, self.lexical_index, query, k=limits["user"], required_terms=required)
+            if lexical_hits:
+                skipped = [name for name in limits if self.collection_store(name)]
+                search_metrics.record([], skipped, has_context=True, lexical_only=True)
+                print(f"🔤 Exact-term query answered from the lexical index ({', '.join(required)})")
+                return {"system": [], "user": lexical_hits}
         
-        # Search both knowledge bases
-        system_docs = self.search_system_knowledge(query, k=2)
-        user_docs = []
+        for name in self.search_policy.search_order(platform_first):
+            if not self.collection_store(name):
+                continue
+            if any(self.search_policy.is_decisive(hits[other]) for other in searched):
+                skipped.append(name)
+                continue
+            if vector is None:
+                vector = embed_queries(self.embeddings, [query])[0]
+            hits[name] = self.search_policy.relevant(self.search_by_vector(name, vector, k=limits[name]))
+            searched.append(name)
         
-        # For academic queries or mixed queries, also search user documents
-        if not is_platform_query or any(word in query.lower() for word in ['study', 'learn', 'academic', 'notes', 'papers']):
-            user_docs = self.search_user_documents(query, k=3)
+        # Fuse relevant dense user hits with the BM25 ranking, so exact terms the embedding misses still surface
+        if hits["user"]:
+            lexical_hits = lexical_search(self.user_docs_db, self.lexical_index, query, k=limits["user"])
+            hits["user"] = reciprocal_rank_fusion([hits["user"], lexical_hits])[:limits["user"]]
         
-        # Prepare context
+        search_metrics.record(searched, skipped, has_context=any(hits.values()))
+        if skipped:
+            print(f"⚡ Decisive {searched[0]} hit, skipped the {', '.join(skipped)} search")
+        return hits
+
+    def response_flow(self, plan):
+        """Flow that runs the chat model on a prepared response plan"""
+        result = yield ChatStep(plan["prompt"] | self.chat_model, plan["inputs"])
+        return {
+            "answer": result.content,
+            "sources": plan["sources"],
+            "strategy": plan["strategy"],
+            "chunk_ids": plan["chunk_ids"]
+        }
+
+    def generate_response(self, plan):
+        """Run the chat model on a prepared response plan"""
+        return run_flow(self.response_flow(plan))
+
+    def platform_plan(self, query, system_hits):
+        """Build the platform prompt from system knowledge hits alone"""
+        system_docs = [doc for _, doc, _ in system_hits]
         system_context = "\n\n".join([doc.page_content for doc in system_docs])
-        user_context = "\n\n".join([doc.page_content for doc in user_docs])
         
-        # Choose appropriate template based on available context
-        if is_platform_query and system_context:
-            # Platform-specific query with system knowledge
-            template = """You are the official AI assistant for Scholara Collective, a free academic resource sharing platform.
+        template = """You are the official AI assistant for Scholara Collective, a free academic resource sharing platform.
 
 SCHOLARA PLATFORM INFORMATION:
 {system_context}
@@ -334,16 +413,44 @@ SCHOLARA PLATFORM INFORMATION:
 USER QUESTION: {query}
 
 Based on the platform information above, provide a helpful, informative response about Scholara Collective. Be friendly, detailed, and guide users on how to effectively use the platform. If they're asking about specific features, explain them clearly with step-by-step instructions when helpful:"""
-            
-            prompt = PromptTemplate(template=template, input_variables=["system_context", "query"])
-            response = prompt | self.chat_model
-            result = response.invoke({"system_context": system_context, "query": query})
-            
-            return {
-                "answer": result.content,
-                "sources": system_docs,
-                "strategy": "platform_knowledge"
-            }
+        
+        prompt = PromptTemplate(template=template, input_variables=["system_context", "query"])
+        return {
+            "prompt": prompt,
+            "inputs": {"system_context": system_context, "query": query},
+            "sources": system_docs,
+            "strategy": "platform_knowledge",
+            "chunk_ids": {"system": [chunk_id for chunk_id, _, _ in system_hits], "user": []}
+        }
+
+    def prepare_platform_response(self, query, vector):
+        """Plan an answer to a curated platform question from system knowledge only, never user documents"""
+        # Curated questions are about the platform by construction, so the top hits are used without the relevance threshold
+        return self.platform_plan(query, self.search_by_vector("system", vector, k=2))
+
+    def prepare_comprehensive_response(self, query, intent=None, vector=None):
+        """Retrieve context and pick the prompt for a query, without calling the chat model"""
+        
+        # The classified intent (or, without one, the keyword check) only decides which collection is searched first
+        platform_first = intent == 'PLATFORM' if intent else self.is_platform_related_query(query)
+        hits = self.search_collections(query, platform_first=platform_first, vector=vector)
+        system_hits, user_hits = hits["system"], hits["user"]
+        
+        system_docs = [doc for _, doc, _ in system_hits]
+        user_docs = [doc for _, doc, _ in user_hits]
+        chunk_ids = {
+            "system": [chunk_id for chunk_id, _, _ in system_hits],
+            "user": [chunk_id for chunk_id, _, _ in user_hits],
+        }
+        
+        # Prepare context
+        system_context = "\n\n".join([doc.page_content for doc in system_docs])
+        user_context = "\n\n".join([doc.page_content for doc in user_docs])
+        
+        # Choose appropriate template based on the context that scored as relevant
+        if system_context and not user_context:
+            # Platform-specific query with system knowledge
+            return self.platform_plan(query, system_hits)
             
         elif user_context and system_context:
             # Mixed query - both platform and document content
@@ -360,17 +467,16 @@ USER QUESTION: {query}
 Provide a comprehensive answer using both the platform information and academic resources above. If the question relates to using Scholara Collective, focus on platform guidance. For academic content questions, use the community-shared resources while mentioning these materials come from our collaborative learning community:"""
             
             prompt = PromptTemplate(template=template, input_variables=["system_context", "user_context", "query"])
-            response = prompt | self.chat_model
-            result = response.invoke({
-                "system_context": system_context, 
-                "user_context": user_context, 
-                "query": query
-            })
-            
             return {
-                "answer": result.content,
+                "prompt": prompt,
+                "inputs": {
+                    "system_context": system_context, 
+                    "user_context": user_context, 
+                    "query": query
+                },
                 "sources": system_docs + user_docs,
-                "strategy": "hybrid_knowledge"
+                "strategy": "hybrid_knowledge",
+                "chunk_ids": chunk_ids
             }
             
         elif user_context:
@@ -385,17 +491,16 @@ USER QUESTION: {query}
 Provide an educational answer based on the academic resources above from our community-shared materials. These resources have been contributed by students and educators on the Scholara Collective platform to help with collaborative learning:"""
             
             prompt = PromptTemplate(template=template, input_variables=["user_context", "query"])
-            response = prompt | self.chat_model
-            result = response.invoke({"user_context": user_context, "query": query})
-            
             return {
-                "answer": result.content,
+                "prompt": prompt,
+                "inputs": {"user_context": user_context, "query": query},
                 "sources": user_docs,
-                "strategy": "academic_resources"
+                "strategy": "academic_resources",
+                "chunk_ids": chunk_ids
             }
             
         else:
-            # General knowledge fallback
+            # General knowledge fallback: nothing scored as relevant, so no retrieved context is used
             template = """You are the AI assistant for Scholara Collective, a free academic resource sharing platform.
 
 The user asked: {query}
@@ -405,28 +510,133 @@ This question isn't directly covered by our platform resources or community-uplo
 Provide a comprehensive, educational response:"""
             
             prompt = PromptTemplate(template=template, input_variables=["query"])
-            response = prompt | self.chat_model
-            result = response.invoke({"query": query})
-            
             return {
-                "answer": result.content,
+                "prompt": prompt,
+                "inputs": {"query": query},
                 "sources": [],
-                "strategy": "general_knowledge"
+                "strategy": "general_knowledge",
+                "chunk_ids": chunk_ids
             }
 
+    def prepare_follow_up_response(self, query, session):
+        """Load the cached context for a follow-up question and build its prompt"""
+        chunk_ids = session["chunk_ids"]
+        system_docs = [doc for _, doc in fetch_by_ids(self.system_db, chunk_ids.get("system", []))]
+        user_docs = [doc for _, doc in fetch_by_ids(self.user_docs_db, chunk_ids.get("user", []))]
+        context = "\n\n".join([doc.page_content for doc in system_docs + user_docs])
+        
+        template = """You are the AI assistant for Scholara Collective, a free academic resource sharing platform.
+
+CONVERSATION SO FAR:
+{history}
+
+CONTEXT USED IN THE CONVERSATION:
+{context}
+
+FOLLOW-UP QUESTION: {query}
+
+Answer the follow-up question in the context of the conversation above. Use the same context where it is relevant and keep the answer consistent with what was already said:"""
+        
+        prompt = PromptTemplate(template=template, input_variables=["history", "context", "query"])
+        return {
+            "prompt": prompt,
+            "inputs": {"history": session["summary"], "context": context, "query": query},
+            "sources": system_docs + user_docs,
+            "strategy": "conversation_follow_up",
+            "chunk_ids": chunk_ids
+        }
+
+
+def format_source_documents(docs):
+    """Format knowledge manager sources for the /query response"""
+    source_docs = []
+    for doc in docs:
+        source_docs.append({
+            "source": doc.metadata.get('source', 'Unknown'),
+            "type": doc.metadata.get('type', 'unknown'),
+            "content_preview": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content
+        })
+    return source_docs
+
 
 # Global variables
+index_snapshot = None
 knowledge_manager = None
 user_qa_chain = None
+faq_table = None
+session_store = SessionStore()
+admission = AdmissionController()
+maintenance = MaintenanceRunner(embeddings, admission)
+
+def setup_index_snapshot():
+    """Memory-map the portable index snapshot, if one is deployed with this node, and restore the files bundled with it"""
+    global index_snapshot
+    try:
+        index_snapshot = load_snapshot(embeddings)
+        if index_snapshot:
+            # Must run before the lexical index is first opened; files this node already has are kept
+            restored = restore_snapshot_files({"faq_table": FAQ_CACHE_PATH, "lexical_index": LEXICAL_INDEX_PATH})
+            if restored:
+                print(f"📦 Restored {', '.join(restored)} from index snapshot")
+    except SnapshotError as e:
+        print(f"❌ Refusing index snapshot: {e}")
+        index_snapshot = None
+    except Exception as e:
+        print(f"❌ Error loading index snapshot: {e}")
+        index_snapshot = None
+
+
+def get_user_docs_store():
+    """User documents ChromaDB, or the read-only snapshot when the local database is missing"""
+    db = get_chroma_db(embeddings)
+    if db is None and index_snapshot and index_snapshot.get("user_docs"):
+        print("📦 Serving user documents from index snapshot (read-only)")
+        return index_snapshot["user_docs"]
+    return db
+
+
+def setup_lexical_index():
+    """Index any user document chunks missing from the lexical index (e.g. stored before it existed)"""
+    db = get_user_docs_store()
+    if db is None:
+        return
+    try:
+        collection = getattr(db, "_collection", db)
+        added = get_lexical_index().sync(collection)
+        if added:
+            print(f"✅ Added {added} chunks to the lexical index")
+    except Exception as e:
+        print(f"❌ Error syncing lexical index: {e}")
+
+
+def hydrate_user_docs_from_snapshot():
+    """Before the first write on a snapshot-backed node, copy the snapshot into a writable ChromaDB"""
+    if not index_snapshot or not index_snapshot.get("user_docs"):
+        return
+    # Checked and imported under the writer lock, so two concurrent uploads cannot both import
+    with _index_writer_lock:
+        if get_chroma_db(embeddings) is not None:
+            return
+        snapshot_docs = index_snapshot["user_docs"]
+        if snapshot_docs.count() == 0:
+            return
+        print(f"📦 Importing {snapshot_docs.count()} snapshot chunks into {CHROMA_DB_PATH}...")
+        db = Chroma(
+            persist_directory=CHROMA_DB_PATH,
+            embedding_function=embeddings,
+            collection_metadata=fingerprint_metadata(embeddings)
+        )
+        import_snapshot_collection(snapshot_docs, db)
+
 
 def setup_knowledge_system():
     """Initialize the comprehensive knowledge system"""
     global knowledge_manager
     try:
-        knowledge_manager = ScholaraKnowledgeManager(embeddings, chat_model)
+        knowledge_manager = ScholaraKnowledgeManager(embeddings, chat_model, snapshot=index_snapshot)
         
         # Connect user documents database
-        user_db = get_chroma_db(embeddings)
+        user_db = get_user_docs_store()
         knowledge_manager.user_docs_db = user_db
         
         print("✅ Scholara Collective knowledge system initialized successfully")
@@ -438,19 +648,45 @@ def setup_knowledge_system():
         print(f"❌ Error setting up knowledge system: {e}")
 
 
+def setup_faq_table():
+    """Load or pre-generate canonical answers for curated platform questions"""
+    global faq_table
+    if not knowledge_manager or not knowledge_manager.system_db:
+        print("⚠️ System knowledge not available. Skipping FAQ answer table.")
+        return
+
+    def answer_platform_question(question, vector):
+        result = knowledge_manager.generate_response(knowledge_manager.prepare_platform_response(question, vector))
+        return {
+            "answer": result['answer'],
+            "source_documents": format_source_documents(result['sources']),
+            "chunk_ids": result['chunk_ids']
+        }
+
+    try:
+        table = FAQAnswerTable(embeddings)
+        table.load_or_build(
+            SCHOLARA_KNOWLEDGE,
+            answer_platform_question,
+            model_names=[chat_model.model_name, embeddings.model_name]
+        )
+        faq_table = table
+    except Exception as e:
+        print(f"❌ Error setting up FAQ answer table: {e}")
+
+
 def setup_legacy_qa_chain():
     """Setup legacy QA chain for backward compatibility"""
     global user_qa_chain
-    db = get_chroma_db(embeddings)
+    db = get_user_docs_store()
     if db:
         print("⚡ Setting up legacy QA chain for user documents...")
-        retriever = db.as_retriever(search_kwargs={"k": 5})
 
         def enhanced_hybrid_chain(inputs):
             question = inputs["query"]
             
             # Enhanced retrieval
-            docs = get_enhanced_retrieval(retriever, question)
+            docs = get_enhanced_retrieval(db, question, allow_lexical_only=inputs.get("intent") != 'PLATFORM')
             context_text = "\n\n".join([d.page_content for d in docs]) if docs else "No relevant documents."
             
             # Evaluate context quality
@@ -542,38 +778,29 @@ Respond with only a number (1-5):"""
     except:
         return 3
 
-def get_enhanced_retrieval(retriever, question, k=5):
+def get_enhanced_retrieval(db, question, k=5, allow_lexical_only=True):
     """Enhanced retrieval with multiple strategies"""
     try:
-        docs = retriever.get_relevant_documents(question)
-        
-        if len(docs) < 2:
-            key_terms = question.lower().split()
-            broader_query = " ".join([term for term in key_terms if len(term) > 3])
-            if broader_query and broader_query != question.lower():
-                broader_docs = retriever.get_relevant_documents(broader_query)
-                docs.extend(broader_docs)
-        
-        # Remove duplicates
-        seen_content = set()
-        unique_docs = []
-        for doc in docs:
-            content_hash = hashlib.md5(doc.page_content.encode()).hexdigest()
-            if content_hash not in seen_content:
-                seen_content.add(content_hash)
-                unique_docs.append(doc)
-        
-        return unique_docs[:k]
+        # Hybrid retrieval: exact-term queries come straight from the BM25 index, everything
+        # else fuses the dense rankings of the question and a broader keyword-only variant
+        # (embedded in one batched call) with the BM25 ranking, deduplicated by chunk id.
+        key_terms = question.lower().split()
+        broader_query = " ".join([term for term in key_terms if len(term) > 3])
+        hits = hybrid_search(
+            db, embeddings, get_lexical_index(), question, k=k,
+            variants=[broader_query], allow_lexical_only=allow_lexical_only,
+        )
+        return [doc for _, doc, _ in hits]
     except Exception as e:
         print(f"❌ Error in enhanced retrieval: {e}")
         return []
 
 
 # Enhanced query classification
-def classify_query_intent(query):
-    """Use LLM to classify query intent"""
-    classification_prompt = PromptTemplate(
-        template="""Analyze this user input and classify it into ONE category:
+QUERY_INTENTS = ['CASUAL', 'PLATFORM', 'ACADEMIC', 'UNCLEAR']
+
+classification_prompt = PromptTemplate(
+    template="""Analyze this user input and classify it into ONE category:
 
 CASUAL: Simple greetings, small talk, polite conversation (hello, how are you, thanks, bye, etc.)
 PLATFORM: Questions about Scholara Collective platform, features, how to use the site, uploading, downloading
@@ -591,94 +818,255 @@ Examples:
 User input: "{query}"
 
 Respond with ONLY the category (CASUAL, PLATFORM, ACADEMIC, or UNCLEAR):""",
-        input_variables=["query"]
-    )
-    
+    input_variables=["query"]
+)
+
+
+def parse_query_intent(content):
+    """Map the classifier output to a known intent"""
+    intent = content.strip().upper()
+    if intent in QUERY_INTENTS:
+        return intent
+    return 'ACADEMIC'  # Default fallback
+
+
+def classify_intent_flow(query):
+    """Flow that uses the LLM to classify query intent"""
     try:
         chain = classification_prompt | chat_model
-        response = chain.invoke({"query": query})
-        intent = response.content.strip().upper()
-        
-        if intent in ['CASUAL', 'PLATFORM', 'ACADEMIC', 'UNCLEAR']:
-            return intent
-        return 'ACADEMIC'  # Default fallback
+        response = yield ChatStep(chain, {"query": query})
+        return parse_query_intent(response.content)
             
     except Exception as e:
         print(f"❌ Error in classification: {e}")
         return 'ACADEMIC'
 
 
-def generate_casual_response_with_llm(query):
-    """Generate natural casual responses"""
-    casual_prompt = PromptTemplate(
-        template="""You are the friendly AI assistant for Scholara Collective, a free academic resource sharing platform.
+def classify_query_intent(query):
+    """Use LLM to classify query intent"""
+    return run_flow(classify_intent_flow(query))
+
+
+casual_prompt = PromptTemplate(
+    template="""You are the friendly AI assistant for Scholara Collective, a free academic resource sharing platform.
 
 User said: "{query}"
 
 Respond naturally and warmly. Keep it brief (1-2 sentences), friendly, and offer to help with platform questions or academic topics. Mention that Scholara Collective is here to help with their academic journey:""",
-        input_variables=["query"]
-    )
-    
+    input_variables=["query"]
+)
+
+casual_fallback_response = "Hello! I'm here to help you with Scholara Collective and answer any academic questions. What would you like to know?"
+
+
+def casual_response_flow(query):
+    """Flow that generates a natural casual response"""
     try:
         chain = casual_prompt | chat_model
-        response = chain.invoke({"query": query})
+        response = yield ChatStep(chain, {"query": query})
         return response.content.strip()
     except Exception as e:
-        return "Hello! I'm here to help you with Scholara Collective and answer any academic questions. What would you like to know?"
+        return casual_fallback_response
 
 
 # Initialize systems
+get_ingestion_pool(embeddings)
+try:
+    verify_chroma_db(embeddings)
+except EmbeddingMismatch as e:
+    print(f"❌ {e}")
+    sys.exit()
+setup_index_snapshot()
+setup_lexical_index()
 setup_knowledge_system()
 setup_legacy_qa_chain()
+setup_faq_table()
+maintenance.start_schedule()
 
 
 # -------------------------------
-# Flask Routes
+# Request Handlers
 # -------------------------------
 
-@app.route('/process-document', methods=['POST'])
-def process_document_endpoint():
-    data = request.json
+unclear_response = """I'd be happy to help! Could you please clarify what you're looking for? 
+
+I can assist you with:
+• Questions about using Scholara Collective (uploading, downloading, searching resources)
+• Academic questions using our community-shared study materials
+• General educational topics and learning support
+
+What specific information would you like to know more about?"""
+
+general_prompt = PromptTemplate(
+    template="""You are the AI assistant for Scholara Collective, a free academic resource sharing platform.
+
+The user asked: {question}
+
+Currently, there are no specific documents or platform resources available that directly relate to this question, but I can provide a helpful educational answer using general knowledge. If this is an academic question, I can suggest how Scholara Collective's community resources might help them find more detailed study materials.
+
+Provide a comprehensive, helpful response:""",
+    input_variables=["question"]
+)
+
+
+def process_document(data):
+    """Handle a /process-document request body, returning (payload, status)"""
     document_title = data.get('title')
     text_content = data.get('text')
     text_hash = data.get('text_hash')
 
     if not document_title or not text_content:
-        return jsonify({"error": "Missing title or text content."}), 400
+        return {"error": "Missing title or text content."}, 400
 
     print(f"📄 Processing document: {document_title}")
     
     try:
-        process_document_and_add_to_db(document_title, text_content, text_hash, embeddings)
+        hydrate_user_docs_from_snapshot()
+        ingestion = process_document_and_add_to_db(document_title, text_content, text_hash, embeddings)
         # Refresh the knowledge system after adding new documents
         setup_knowledge_system()
         setup_legacy_qa_chain()
-        return jsonify({"message": f"Document '{document_title}' processed successfully."}), 200
+        payload = {"message": f"Document '{document_title}' processed successfully."}
+        if ingestion and ingestion["status"] == "already_indexed":
+            payload["message"] = f"Document '{document_title}' has already been indexed; nothing new was embedded."
+        elif ingestion and ingestion["status"] == "near_duplicate":
+            payload["message"] = (
+                f"Document '{document_title}' is a near-duplicate of '{ingestion['duplicate_of']['title']}' "
+                "and was linked to it instead of being indexed again."
+            )
+        if ingestion:
+            payload["ingestion"] = ingestion
+        return payload, 200
     except Exception as e:
         print(f"❌ Error processing document: {e}")
-        return jsonify({"error": "Failed to process document."}), 500
+        return {"error": "Failed to process document."}, 500
+
+
+def finish_query(session_id, user_query, payload, chunk_ids=None):
+    """Record the turn in the caller's session (if any) and return the /query payload"""
+    if session_id:
+        # Only turns that retrieved context replace the cached chunk ids and intent
+        intent = payload["query_intent"].upper() if chunk_ids is not None else None
+        session_store.record_turn(session_id, user_query, payload["answer"], intent=intent, chunk_ids=chunk_ids)
+        payload["session_id"] = session_id
+    return payload
+
+
+def knowledge_payload(result, query_intent):
+    """Build the /query payload for a knowledge manager result"""
+    return {
+        "answer": result['answer'],
+        "source_documents": format_source_documents(result['sources']),
+        "strategy_used": result['strategy'],
+        "query_intent": query_intent.lower()
+    }
 
 
-@app.route('/query', methods=['POST'])
-def query_documents():
-    data = request.json
+def faq_payload(faq_entry):
+    """Build the /query payload for a pre-generated FAQ answer"""
+    return {
+        "answer": faq_entry['answer'],
+        "source_documents": faq_entry['source_documents'],
+        "strategy_used": "faq_cache",
+        "query_intent": "platform"
+    }
+
+
+def lookup_faq_answer(user_query):
+    """
+    Embed the query and match it against the pre-generated FAQ table. Returns (entry, vector),
+    so a query that misses the table is searched with the same vector instead of embedding again.
+    """
+    # Exact-term queries (course codes, question numbers) are never curated platform questions, and skipping
+    # the table lets the lexical index answer them without embedding at all
+    if not faq_table or exact_terms(user_query):
+        return None, None
+    try:
+        vector = embed_queries(embeddings, [user_query])[0]
+        faq_entry, similarity = faq_table.match_vector(vector)
+    except Exception as e:
+        print(f"❌ Error in FAQ lookup: {e}")
+        return None, None
+    if faq_entry:
+        print(f"⚡ FAQ match ({similarity:.3f}): {faq_entry['question']}")
+    return faq_entry, vector
+
+
+def legacy_query(user_query, query_intent):
+    """Answer through the legacy QA chain"""
+    print("🔄 Falling back to legacy QA chain")
+    result = user_qa_chain({"query": user_query, "intent": query_intent})
+    
+    response_data = {
+        "answer": result['result'],
+        "source_documents": [],
+        "strategy_used": result.get('strategy_used', 'legacy'),
+        "query_intent": query_intent.lower()
+    }
+
+    for doc in result['source_documents']:
+        response_data['source_documents'].append({
+            "source": doc.metadata.get('source', 'Unknown Document'),
+            "text_hash": doc.metadata.get('text_hash', 'N/A'),
+            "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
+        })
+
+    return response_data
+
+
+def general_payload(answer, query_intent):
+    """Build the /query payload for the pure general knowledge fallback"""
+    return {
+        "answer": answer,
+        "source_documents": [],
+        "strategy_used": "pure_general_knowledge",
+        "query_intent": query_intent.lower()
+    }
+
+
+def answer_query_flow(data):
+    """
+    The /query flow, shared by the Flask and ASGI apps: yields its blocking work as CpuSteps and its
+    chat model calls as ChatSteps, and returns (payload, status)
+    """
     user_query = data.get('query')
 
     if not user_query:
-        return jsonify({"error": "Missing query."}), 400
+        return {"error": "Missing query."}, 400
 
     user_query = user_query.strip()
     print(f"❓ User query: {user_query}")
 
+    # Optional conversation session: follow-ups reuse the previous turn's context
+    session_id = data.get('session_id')
+    if session_id is not None and not isinstance(session_id, str):
+        return {"error": "session_id must be a string."}, 400
+    session = session_store.get(session_id)
+
+    if knowledge_manager and is_follow_up_query(user_query, session):
+        print(f"🔁 Follow-up in session {session_id}, reusing cached context")
+        try:
+            plan = yield CpuStep(knowledge_manager.prepare_follow_up_response, user_query, session)
+            result = yield from knowledge_manager.response_flow(plan)
+            payload = knowledge_payload(result, session["intent"] or 'ACADEMIC')
+            return finish_query(session_id, user_query, payload), 200
+        except Exception as e:
+            print(f"❌ Error answering follow-up, falling back to a fresh search: {e}")
+
+    # Curated platform questions are answered straight from the pre-generated FAQ table
+    faq_entry, query_vector = yield CpuStep(lookup_faq_answer, user_query)
+    if faq_entry:
+        return finish_query(session_id, user_query, faq_payload(faq_entry), chunk_ids=faq_entry['chunk_ids']), 200
+
     # Classify query intent
-    query_intent = classify_query_intent(user_query)
+    query_intent = yield from classify_intent_flow(user_query)
     print(f"🎯 Query intent: {query_intent}")
 
     try:
         # Handle based on intent
         if query_intent == 'CASUAL':
-            casual_response = generate_casual_response_with_llm(user_query)
-            return jsonify({
+            casual_response = yield from casual_response_flow(user_query)
+            return finish_query(session_id, user_query, {
                 "answer": casual_response,
                 "source_documents": [],
                 "strategy_used": "casual_conversation",
@@ -686,16 +1074,7 @@ def query_documents():
             }), 200
         
         elif query_intent == 'UNCLEAR':
-            unclear_response = """I'd be happy to help! Could you please clarify what you're looking for? 
-
-I can assist you with:
-• Questions about using Scholara Collective (uploading, downloading, searching resources)
-• Academic questions using our community-shared study materials
-• General educational topics and learning support
-
-What specific information would you like to know more about?"""
-            
-            return jsonify({
+            return finish_query(session_id, user_query, {
                 "answer": unclear_response,
                 "source_documents": [],
                 "strategy_used": "clarification_needed",
@@ -705,112 +1084,80 @@ What specific information would you like to know more about?"""
         else:
             # PLATFORM or ACADEMIC queries - use enhanced knowledge manager
             if knowledge_manager:
-                result = knowledge_manager.get_comprehensive_response(user_query)
-                
-                # Format source documents
-                source_docs = []
-                for doc in result['sources']:
-                    source_docs.append({
-                        "source": doc.metadata.get('source', 'Unknown'),
-                        "type": doc.metadata.get('type', 'unknown'),
-                        "content_preview": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content
-                    })
-                
-                return jsonify({
-                    "answer": result['answer'],
-                    "source_documents": source_docs,
-                    "strategy_used": result['strategy'],
-                    "query_intent": query_intent.lower()
-                }), 200
+                plan = yield CpuStep(knowledge_manager.prepare_comprehensive_response, user_query, query_intent, query_vector)
+                result = yield from knowledge_manager.response_flow(plan)
+                payload = knowledge_payload(result, query_intent)
+                return finish_query(session_id, user_query, payload, chunk_ids=result['chunk_ids']), 200
             
             # Fallback to legacy system if knowledge manager fails
             elif user_qa_chain:
-                print("🔄 Falling back to legacy QA chain")
-                result = user_qa_chain({"query": user_query})
-                
-                response_data = {
-                    "answer": result['result'],
-                    "source_documents": [],
-                    "strategy_used": result.get('strategy_used', 'legacy'),
-                    "query_intent": query_intent.lower()
-                }
-
-                for doc in result['source_documents']:
-                    response_data['source_documents'].append({
-                        "source": doc.metadata.get('source', 'Unknown Document'),
-                        "text_hash": doc.metadata.get('text_hash', 'N/A'),
-                        "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
-                    })
-
-                return jsonify(response_data), 200
+                # The legacy chain is a rarely used fallback, so it runs as one blocking step
+                payload = yield CpuStep(legacy_query, user_query, query_intent)
+                return finish_query(session_id, user_query, payload, chunk_ids={}), 200
                 
             else:
                 # Pure general knowledge fallback
                 print("🧠 Using pure general knowledge fallback")
-                general_prompt = PromptTemplate(
-                    template="""You are the AI assistant for Scholara Collective, a free academic resource sharing platform.
-
-The user asked: {question}
-
-Currently, there are no specific documents or platform resources available that directly relate to this question, but I can provide a helpful educational answer using general knowledge. If this is an academic question, I can suggest how Scholara Collective's community resources might help them find more detailed study materials.
-
-Provide a comprehensive, helpful response:""",
-                    input_variables=["question"]
-                )
-                
                 general_chain = general_prompt | chat_model
-                response = general_chain.invoke({"question": user_query})
-                
-                return jsonify({
-                    "answer": response.content,
-                    "source_documents": [],
-                    "strategy_used": "pure_general_knowledge",
-                    "query_intent": query_intent.lower()
-                }), 200
+                response = yield ChatStep(general_chain, {"question": user_query})
+                payload = general_payload(response.content, query_intent)
+                return finish_query(session_id, user_query, payload, chunk_ids={}), 200
             
     except Exception as e:
         print(f"❌ Error processing query: {e}")
-        return jsonify({"error": "An error occurred while processing your query. Please try again."}), 500
+        return {"error": "An error occurred while processing your query. Please try again."}, 500
 
 
-@app.route('/stats', methods=['GET'])
-def get_stats():
-    """Get platform statistics"""
+def answer_query(data):
+    """Handle a /query request body, returning (payload, status); only its CPU steps take an interactive slot"""
+    return run_flow(answer_query_flow(data), admit=lambda: admission.admit("interactive"))
+
+
+def platform_stats():
+    """Get platform statistics, returning (payload, status)"""
     try:
-        user_db = get_chroma_db(embeddings)
+        user_db = get_user_docs_store()
         system_docs = 0
         user_docs = 0
         
         if user_db:
-            collection = user_db._collection
+            collection = getattr(user_db, "_collection", user_db)
             user_docs = collection.count()
         
         if knowledge_manager and knowledge_manager.system_db:
-            system_collection = knowledge_manager.system_db._collection
+            system_collection = getattr(knowledge_manager.system_db, "_collection", knowledge_manager.system_db)
             system_docs = system_collection.count()
             
-        return jsonify({
+        return {
             "total_user_documents": user_docs,
             "system_knowledge_items": system_docs,
             "status": "operational",
             "knowledge_system_ready": knowledge_manager is not None,
-            "legacy_qa_ready": user_qa_chain is not None
-        }), 200
+            "legacy_qa_ready": user_qa_chain is not None,
+            "active_sessions": len(session_store),
+            "retrieval": search_metrics.stats(),
+            "lexical_index_chunks": get_lexical_index().count(),
+            "maintenance": maintenance.status(),
+            "admission": admission.stats(),
+            "embedding": {
+                "ingestion": get_ingestion_pool(embeddings).stats(),
+                "query": query_meter.stats()
+            }
+        }, 200
         
     except Exception as e:
         print(f"❌ Error getting stats: {e}")
-        return jsonify({
+        return {
             "total_user_documents": 0,
             "system_knowledge_items": 0,
             "status": "error",
             "knowledge_system_ready": False,
             "legacy_qa_ready": False
-        }), 500
+        }, 500
 
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Health check endpoint with detailed system status"""
+def health_status():
+    """Detailed system status, returning (payload, status)"""
     system_status = {
         "status": "healthy",
         "knowledge_manager_ready": knowledge_manager is not None,
@@ -821,38 +1168,83 @@ def health_check():
         "timestamp": "2025-08-30"
     }
     
-    return jsonify(system_status), 200
+    return system_status, 200
 
 
-@app.route('/refresh-system', methods=['POST'])
-def refresh_system_knowledge():
-    """Endpoint to refresh/rebuild system knowledge (admin use)"""
+def refresh_system():
+    """Refresh/rebuild system knowledge (admin use), returning (payload, status)"""
     try:
         # Reinitialize the knowledge system
         setup_knowledge_system()
         setup_legacy_qa_chain()
         
-        return jsonify({
+        return {
             "message": "System knowledge refreshed successfully",
             "status": "success"
-        }), 200
+        }, 200
         
     except Exception as e:
         print(f"❌ Error refreshing system: {e}")
-        return jsonify({
+        return {
             "error": "Failed to refresh system knowledge",
             "status": "error"
-        }), 500
+        }, 500
 
 
-@app.route('/test-query', methods=['POST'])
-def test_query():
-    """Test endpoint for debugging different query types"""
-    data = request.json
+def export_index_snapshot():
+    """Write the current indexes to the portable snapshot file (admin use), returning (payload, status)"""
+    lexical_copy = f"{INDEX_SNAPSHOT_PATH}.lexical.tmp"
+    try:
+        # Bundle the FAQ answer table and the lexical index, so a node started from the snapshot is query-ready
+        get_lexical_index().copy_to(lexical_copy)
+        files = {"lexical_index": lexical_copy}
+        if os.path.exists(FAQ_CACHE_PATH):
+            files["faq_table"] = FAQ_CACHE_PATH
+        result = export_snapshot({
+            "user_docs": get_user_docs_store(),
+            "system_knowledge": knowledge_manager.system_db if knowledge_manager else None
+        }, embeddings, path=INDEX_SNAPSHOT_PATH, files=files)
+        return {
+            "message": "Index snapshot exported successfully",
+            "status": "success",
+            "snapshot": result
+        }, 200
+
+    except Exception as e:
+        print(f"❌ Error exporting index snapshot: {e}")
+        return {
+            "error": "Failed to export index snapshot",
+            "status": "error"
+        }, 500
+    finally:
+        if os.path.exists(lexical_copy):
+            os.remove(lexical_copy)
+
+
+def start_maintenance(data):
+    """Start a background index maintenance run (admin use), returning (payload, status)"""
+    known_text_hashes = (data or {}).get('known_text_hashes')
+    if known_text_hashes is not None and (
+        not isinstance(known_text_hashes, list) or not all(isinstance(h, str) for h in known_text_hashes)
+    ):
+        return {"error": "known_text_hashes must be a list of strings."}, 400
+
+    if not maintenance.start(known_text_hashes=known_text_hashes):
+        return {"error": "Index maintenance is already running", "maintenance": maintenance.status()}, 409
+    return {"message": "Index maintenance started", "maintenance": maintenance.status()}, 202
+
+
+def maintenance_status():
+    """Progress and report of the latest index maintenance run, returning (payload, status)"""
+    return maintenance.status(), 200
+
+
+def run_test_query(data):
+    """Debug different query types, returning (payload, status)"""
     test_query = data.get('query')
     
     if not test_query:
-        return jsonify({"error": "Missing test query"}), 400
+        return {"error": "Missing test query"}, 400
     
     try:
         # Get intent classification
@@ -861,23 +1253,104 @@ def test_query():
         # Get platform relevance check
         is_platform = knowledge_manager.is_platform_related_query(test_query) if knowledge_manager else False
         
-        # Get sample results from both knowledge bases
-        system_results = knowledge_manager.search_system_knowledge(test_query, k=1) if knowledge_manager else []
-        user_results = knowledge_manager.search_user_documents(test_query, k=1) if knowledge_manager else []
+        # Get sample results from both knowledge bases; only the searches take an interactive slot
+        with admission.admit("interactive"):
+            system_results = knowledge_manager.search_system_knowledge_with_scores(test_query, k=1) if knowledge_manager else []
+            user_results = knowledge_manager.search_user_documents_with_scores(test_query, k=1) if knowledge_manager else []
         
-        return jsonify({
+        return {
             "test_query": test_query,
             "classified_intent": intent,
             "is_platform_related": is_platform,
             "system_knowledge_found": len(system_results),
             "user_documents_found": len(user_results),
-            "system_sample": system_results[0].page_content[:100] + "..." if system_results else "No results",
-            "user_sample": user_results[0].page_content[:100] + "..." if user_results else "No results"
-        }), 200
+            "system_top_score": round(system_results[0][2], 4) if system_results else None,
+            "user_top_score": round(user_results[0][2], 4) if user_results else None,
+            "system_sample": system_results[0][1].page_content[:100] + "..." if system_results else "No results",
+            "user_sample": user_results[0][1].page_content[:100] + "..." if user_results else "No results"
+        }, 200
         
+    except AdmissionRejected:
+        raise
     except Exception as e:
         print(f"❌ Error in test query: {e}")
-        return jsonify({"error": "Test query failed"}), 500
+        return {"error": "Test query failed"}, 500
+
+
+# -------------------------------
+# Flask Routes
+# -------------------------------
+
+@app.errorhandler(AdmissionRejected)
+def handle_admission_rejected(e):
+    """Shed load quickly instead of letting requests time out"""
+    response = jsonify(e.to_payload())
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, e.status
+
+
+@app.route('/process-document', methods=['POST'])
+def process_document_endpoint():
+    with admission.admit("ingestion"):
+        payload, status = process_document(request.json)
+    return jsonify(payload), status
+
+
+@app.route('/query', methods=['POST'])
+def query_documents():
+    payload, status = answer_query(request.json)
+    return jsonify(payload), status
+
+
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    """Get platform statistics"""
+    payload, status = platform_stats()
+    return jsonify(payload), status
+
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Health check endpoint with detailed system status"""
+    payload, status = health_status()
+    return jsonify(payload), status
+
+
+@app.route('/refresh-system', methods=['POST'])
+def refresh_system_knowledge():
+    """Endpoint to refresh/rebuild system knowledge (admin use)"""
+    with admission.admit("admin"):
+        payload, status = refresh_system()
+    return jsonify(payload), status
+
+
+@app.route('/export-snapshot', methods=['POST'])
+def export_snapshot_endpoint():
+    """Endpoint to export the portable index snapshot (admin use)"""
+    with admission.admit("admin"):
+        payload, status = export_index_snapshot()
+    return jsonify(payload), status
+
+
+@app.route('/maintenance', methods=['POST'])
+def start_maintenance_endpoint():
+    """Endpoint to run index maintenance in the background (admin use); the run itself is admitted in the maintenance lane"""
+    payload, status = start_maintenance(request.get_json(silent=True))
+    return jsonify(payload), status
+
+
+@app.route('/maintenance', methods=['GET'])
+def maintenance_status_endpoint():
+    """Status and last report of index maintenance"""
+    payload, status = maintenance_status()
+    return jsonify(payload), status
+
+
+@app.route('/test-query', methods=['POST'])
+def test_query():
+    """Test endpoint for debugging different query types"""
+    payload, status = run_test_query(request.json)
+    return jsonify(payload), status
 
 
 if __name__ == '__main__':
@@ -0,0 +1,476 @@
+import os
+import json
+import time
+import pickle
+import sqlite3
+import threading
+import chromadb
+import numpy as np
+from contextlib import contextmanager
+
+from create import CHROMA_DB_PATH, get_chroma_db, chunk_id_for, _index_writer_lock
+from lexical_index import get_lexical_index
+from near_duplicates import get_near_duplicate_index
+from ingestion_manifest import get_ingestion_manifest
+from admission import AdmissionRejected
+
+# --- Configuration ---
+# Hours between scheduled maintenance runs; 0 disables the schedule (the admin endpoint still works).
+MAINTENANCE_INTERVAL_HOURS = float(os.getenv("MAINTENANCE_INTERVAL_HOURS", "24"))
+# An ingestion still "started" after this long is treated as abandoned and rolled back.
+STALE_INGESTION_SECONDS = int(os.getenv("STALE_INGESTION_SECONDS", "3600"))
+# Chunks read per page and written per writer-lock hold, so ingestion keeps interleaving with maintenance.
+MAINTENANCE_BATCH_SIZE = 500
+LATENCY_PROBES = 20
+# Held for the whole run, so only one process sharing this chroma_db runs maintenance at a time.
+MAINTENANCE_LOCK_PATH = "./maintenance.lock"
+# Without flock or msvcrt the lock is an O_EXCL file, which a killed process leaves behind;
+# one older than this is taken to be stale.
+MAINTENANCE_LOCK_STALE_SECONDS = 6 * 3600
+# Compaction purges chromadb's write-ahead log directly, relying on internals (the embeddings_queue
+# table, the pickled HNSW metadata) only verified against these versions. It VACUUMs INTO a copy while
+# searches keep reading chroma.sqlite3, then copies the compacted pages back with SQLite's backup API,
+# so searches only wait for that copy. Writes from this process are held off throughout; a write from
+# another process during the copy makes the run skip compaction. Off unless MAINTENANCE_COMPACT=1.
+MAINTENANCE_COMPACT = os.getenv("MAINTENANCE_COMPACT", "0") == "1"
+COMPACTION_CHROMADB_VERSIONS = ("0.5.3",)
+
+
+@contextmanager
+def _process_lock(path):
+    """
+    Non-blocking exclusive lock across processes. Yields True if acquired, False if another
+    process holds it. Uses flock on POSIX, msvcrt.locking on Windows, else an O_EXCL lock file.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    if fcntl is not None:
+        with open(path, "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+            else:
+                yield True  # released when the file is closed
+        return
+
+    try:
+        import msvcrt
+    except ImportError:
+        msvcrt = None
+    if msvcrt is not None:
+        with open(path, "a+") as lock_file:
+            try:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            except OSError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        return
+
+    try:
+        if time.time() - os.path.getmtime(path) > MAINTENANCE_LOCK_STALE_SECONDS:
+            os.remove(path)
+    except OSError:
+        pass
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        os.remove(path)
+
+
+def _directory_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def _probe_vectors(collection):
+    sample = collection.get(limit=LATENCY_PROBES, include=["embeddings"])
+    return sample["embeddings"] or []
+
+
+def _search_latency_ms(collection, vectors):
+    """Median latency of single-vector searches, the shape of a live query."""
+    if not vectors or collection.count() == 0:
+        return None
+    timings = []
+    for vector in vectors:
+        started = time.perf_counter()
+        collection.query(query_embeddings=[vector], n_results=5, include=["distances"])
+        timings.append(time.perf_counter() - started)
+    return round(float(np.median(timings)) * 1000, 2)
+
+
+def _source_pairs(metadata):
+    """The (title, text_hash) pairs a chunk belongs to"""
+    metadata = metadata or {}
+    if metadata.get("text_hashes"):
+        return list(zip(json.loads(metadata.get("sources") or "[]"), json.loads(metadata["text_hashes"])))
+    return [(metadata.get("source"), metadata.get("text_hash"))]
+
+
+def _with_sources(metadata, pairs):
+    """A chunk's metadata rewritten to belong to exactly the given (title, text_hash) pairs"""
+    metadata = dict(metadata or {})
+    metadata.update({
+        "source": pairs[0][0],
+        "text_hash": pairs[0][1],
+        "sources": json.dumps([title for title, _ in pairs]),
+        "text_hashes": json.dumps([text_hash for _, text_hash in pairs]),
+        "source_count": len(pairs),
+    })
+    return {key: value for key, value in metadata.items() if value is not None}
+
+
+def _scan(collection):
+    """Reads every chunk's content address and source pairs, page by page, without holding any lock."""
+    chunks, offset = {}, 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=MAINTENANCE_BATCH_SIZE, offset=offset)
+        if not page["ids"]:
+            break
+        for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+            chunks[chunk_id] = {"content_id": chunk_id_for(text or ""), "pairs": _source_pairs(metadata)}
+        offset += len(page["ids"])
+    return chunks
+
+
+def _plan_duplicates(chunks):
+    """Groups chunks with identical normalized text; returns {kept_id: [duplicate ids]}"""
+    groups = {}
+    for chunk_id, chunk in chunks.items():
+        groups.setdefault(chunk["content_id"], []).append(chunk_id)
+    merges = {}
+    for content_id, ids in groups.items():
+        if len(ids) > 1:
+            # Keep the content-addressed copy when there is one, so later uploads link to it
+            keep = content_id if content_id in ids else ids[0]
+            merges[keep] = [chunk_id for chunk_id in ids if chunk_id != keep]
+    return merges
+
+
+def _apply(collection, ids, rewrite):
+    """
+    Applies rewrite(chunk_id, metadata) -> new metadata, or None to delete, in batches under the
+    index writer lock. Metadata is re-read under the lock, so concurrent ingestion links are kept.
+    Returns (deleted_ids, updated_count).
+    """
+    deleted, updated = [], 0
+    lexical_index = get_lexical_index()
+    for start in range(0, len(ids), MAINTENANCE_BATCH_SIZE):
+        batch = ids[start:start + MAINTENANCE_BATCH_SIZE]
+        with _index_writer_lock:
+            current = collection.get(ids=batch, include=["metadatas"])
+            deletes, update_ids, update_metadatas = [], [], []
+            for chunk_id, metadata in zip(current["ids"], current["metadatas"]):
+                new_metadata = rewrite(chunk_id, metadata)
+                if new_metadata is None:
+                    deletes.append(chunk_id)
+                elif new_metadata != metadata:
+                    update_ids.append(chunk_id)
+                    update_metadatas.append(new_metadata)
+            if update_ids:
+                collection.update(ids=update_ids, metadatas=update_metadatas)
+            if deletes:
+                collection.delete(ids=deletes)
+                lexical_index.remove_chunks(deletes)
+        deleted.extend(deletes)
+        updated += len(update_ids)
+    return deleted, updated
+
+
+def _remove_sources(should_remove):
+    """rewrite function dropping the (title, text_hash) pairs should_remove selects, deleting chunks left with none"""
+    def rewrite(chunk_id, metadata):
+        pairs = [pair for pair in _source_pairs(metadata) if not should_remove(chunk_id, pair)]
+        return _with_sources(metadata, pairs) if pairs else None
+    return rewrite
+
+
+def _applied_seq_id(conn, collection_id):
+    """
+    The highest write-ahead log position every segment of the collection has persisted, or None.
+    The vector segment's position lives in its pickled metadata, written when the HNSW index is flushed.
+    """
+    positions = []
+    for segment_id, scope in conn.execute("SELECT id, scope FROM segments WHERE collection = ?", (collection_id,)):
+        if scope == "METADATA":
+            row = conn.execute("SELECT seq_id FROM max_seq_id WHERE segment_id = ?", (segment_id,)).fetchone()
+            if row is None:
+                return None
+            positions.append(int.from_bytes(row[0], "big") if isinstance(row[0], bytes) else int(row[0]))
+        else:
+            path = os.path.join(CHROMA_DB_PATH, segment_id, "index_metadata.pickle")
+            if not os.path.exists(path):
+                return None
+            with open(path, "rb") as f:
+                positions.append(pickle.load(f).max_seq_id)
+    return min(positions) if positions else None
+
+
+def _compact(collection):
+    """
+    Purges write-ahead log entries every segment has persisted, VACUUMs chroma.sqlite3 INTO a copy and
+    swaps the copy in through SQLite's backup API, which open connections see without reconnecting.
+    Call with the index writer lock held. Returns (log entries purged, seconds searches were blocked),
+    with None seconds if another connection wrote during the copy and nothing was swapped in.
+    """
+    live_path = os.path.join(CHROMA_DB_PATH, "chroma.sqlite3")
+    copy_path = live_path + ".compact"
+    conn = sqlite3.connect(live_path, timeout=30)
+    try:
+        purged = 0
+        applied = _applied_seq_id(conn, str(collection.id))
+        if applied is not None:
+            purged = conn.execute(
+                "DELETE FROM embeddings_queue WHERE topic LIKE ? AND seq_id <= ?",
+                (f"%/{collection.id}", applied),
+            ).rowcount
+            conn.commit()
+
+        if os.path.exists(copy_path):
+            os.remove(copy_path)
+        # data_version changes when any other connection commits, so a write the copy missed is detected
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        conn.execute("VACUUM INTO ?", (copy_path,))
+        if conn.execute("PRAGMA data_version").fetchone()[0] != version:
+            return purged, None
+
+        compacted = sqlite3.connect(copy_path)
+        try:
+            swap_started = time.perf_counter()
+            compacted.backup(conn)
+            return purged, time.perf_counter() - swap_started
+        finally:
+            compacted.close()
+    finally:
+        conn.close()
+        if os.path.exists(copy_path):
+            os.remove(copy_path)
+
+
+def run_maintenance(embeddings, known_text_hashes=None):
+    """
+    One maintenance pass over the user documents collection:
+      1. rolls back ingestions that failed or were abandoned half way (per the ingestion manifest)
+      2. removes documents whose text_hash is not in known_text_hashes, when that list is given
+      3. merges duplicate chunks (same normalized text stored under several ids)
+      4. checks every finished document still has the chunks its ingestion produced
+      5. compacts chroma.sqlite3, when MAINTENANCE_COMPACT is set and the chromadb version is verified
+    Returns a report including search latency before and after, and the bytes compaction reclaimed
+    (null with reclaimed_bytes_reason when it did not run, since deletes alone never shrink the files).
+    """
+    started_at = time.time()
+    db = get_chroma_db(embeddings)
+    if db is None:
+        return {"status": "skipped", "reason": f"No ChromaDB at {CHROMA_DB_PATH}"}
+    collection = db._collection
+    manifest = get_ingestion_manifest()
+
+    probes = _probe_vectors(collection)
+    report = {
+        "status": "complete",
+        "chunks_before": collection.count(),
+        "bytes_before": _directory_bytes(CHROMA_DB_PATH),
+        "search_latency_ms": {"before": _search_latency_ms(collection, probes)},
+        "removed_chunks": {},
+    }
+
+    # 1. Half-ingested documents
+    abandoned_before = started_at - STALE_INGESTION_SECONDS
+    broken = [
+        entry for entry in manifest.documents(["started", "failed"])
+        if entry["status"] == "failed" or entry["updated_at"] < abandoned_before
+    ]
+    # Matched on (title, text_hash), since uploads without a text_hash share the same None
+    pairs_by_chunk = {}
+    for entry in broken:
+        for chunk_id in entry["chunk_ids"]:
+            pairs_by_chunk.setdefault(chunk_id, set()).add((entry["title"], entry["text_hash"]))
+    deleted, _ = _apply(
+        collection, list(pairs_by_chunk),
+        _remove_sources(lambda chunk_id, pair: tuple(pair) in pairs_by_chunk[chunk_id]),
+    )
+    for entry in broken:
+        manifest.set_status(entry["document_key"], "rolled_back", error=entry["error"])
+    report["removed_chunks"]["half_ingested"] = len(deleted)
+    report["rolled_back_documents"] = [entry["title"] for entry in broken]
+
+    # 2. and 3. work from one scan of the collection
+    chunks = _scan(collection)
+
+    if known_text_hashes is not None:
+        known = set(known_text_hashes)
+        # Chunks uploaded without a text_hash are never treated as unknown
+        is_unknown = lambda chunk_id, pair: bool(pair[1]) and pair[1] not in known
+        affected = [chunk_id for chunk_id, chunk in chunks.items() if any(is_unknown(chunk_id, pair) for pair in chunk["pairs"])]
+        unknown = {pair[1] for chunk_id in affected for pair in chunks[chunk_id]["pairs"] if is_unknown(chunk_id, pair)}
+        deleted, unlinked = _apply(collection, affected, _remove_sources(is_unknown))
+        get_near_duplicate_index().remove_documents(sorted(unknown))
+        for entry in manifest.documents():
+            if entry["text_hash"] in unknown:
+                manifest.set_status(entry["document_key"], "removed")
+        for chunk_id in deleted:
+            chunks.pop(chunk_id, None)
+        report["removed_chunks"]["unknown_text_hash"] = len(deleted)
+        report["unlinked_chunks"] = unlinked
+        report["removed_documents"] = len(unknown)
+    else:
+        report["removed_chunks"]["unknown_text_hash"] = None  # needs known_text_hashes
+
+    merges = _plan_duplicates(chunks)
+    merged_pairs = {
+        keep: [pair for duplicate in duplicates for pair in chunks[duplicate]["pairs"]]
+        for keep, duplicates in merges.items()
+    }
+    duplicate_ids = {duplicate for duplicates in merges.values() for duplicate in duplicates}
+
+    def merge(chunk_id, metadata):
+        if chunk_id in duplicate_ids:
+            return None
+        pairs = _source_pairs(metadata)
+        for pair in merged_pairs.get(chunk_id, []):
+            if pair[1] not in [text_hash for _, text_hash in pairs]:
+                pairs.append(pair)
+        return _with_sources(metadata, pairs)
+
+    # Update the kept chunks first, so their sources are never lost if the run stops half way
+    _apply(collection, list(merges), merge)
+    deleted, _ = _apply(collection, sorted(duplicate_ids), merge)
+    report["removed_chunks"]["duplicate"] = len(deleted)
+
+    # 4. Integrity: every finished document should still have every chunk its ingestion produced
+    finished = manifest.documents(["complete", "linked"])
+    expected_ids = sorted({chunk_id for entry in finished for chunk_id in entry["chunk_ids"]})
+    present = {}
+    for start in range(0, len(expected_ids), MAINTENANCE_BATCH_SIZE):
+        page = collection.get(ids=expected_ids[start:start + MAINTENANCE_BATCH_SIZE], include=["metadatas"])
+        for chunk_id, metadata in zip(page["ids"], page["metadatas"]):
+            present[chunk_id] = {text_hash for _, text_hash in _source_pairs(metadata)}
+    mismatched = []
+    for entry in finished:
+        found = sum(1 for chunk_id in entry["chunk_ids"] if entry["text_hash"] in present.get(chunk_id, set()))
+        if found != len(entry["chunk_ids"]):
+            mismatched.append({
+                "title": entry["title"],
+                "text_hash": entry["text_hash"],
+                "expected_chunks": len(entry["chunk_ids"]),
+                "found_chunks": found,
+            })
+    report["integrity"] = {"documents_checked": len(finished), "mismatched": mismatched}
+
+    # 5. Compaction
+    if not MAINTENANCE_COMPACT:
+        report["compaction"] = {"status": "disabled", "reason": "Set MAINTENANCE_COMPACT=1 to enable"}
+    elif chromadb.__version__ not in COMPACTION_CHROMADB_VERSIONS:
+        report["compaction"] = {
+            "status": "skipped",
+            "reason": f"chromadb {chromadb.__version__} is not a verified version ({', '.join(COMPACTION_CHROMADB_VERSIONS)})",
+        }
+    else:
+        compact_started = time.perf_counter()
+        with _index_writer_lock:
+            purged, blocking_seconds = _compact(collection)
+        if blocking_seconds is None:
+            report["compaction"] = {
+                "status": "skipped",
+                "reason": "Another process wrote to chroma.sqlite3 during the copy; retried on the next run",
+                "log_entries_purged": purged,
+            }
+        else:
+            report["compaction"] = {
+                "status": "complete",
+                "log_entries_purged": purged,
+                # Ingestion from this process waited this long; searches only waited for the swap
+                "writes_blocked_seconds": round(time.perf_counter() - compact_started, 2),
+                "blocking_seconds": round(blocking_seconds, 2),
+            }
+
+    report["chunks_after"] = collection.count()
+    report["bytes_after"] = _directory_bytes(CHROMA_DB_PATH)
+    if report["compaction"]["status"] == "complete":
+        report["reclaimed_bytes"] = report["bytes_before"] - report["bytes_after"]
+    else:
+        report["reclaimed_bytes"] = None
+        report["reclaimed_bytes_reason"] = f"Compaction {report['compaction']['status']}: {report['compaction']['reason']}"
+    report["search_latency_ms"]["after"] = _search_latency_ms(collection, probes)
+    report["duration_seconds"] = round(time.time() - started_at, 2)
+    return report
+
+
+class MaintenanceRunner:
+    """Runs index maintenance on a background thread, one run at a time, in the maintenance admission lane."""
+
+    def __init__(self, embeddings, admission, interval_hours=MAINTENANCE_INTERVAL_HOURS):
+        self.embeddings = embeddings
+        self.admission = admission
+        self.interval_hours = interval_hours
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last = None
+
+    def _run(self, known_text_hashes, trigger):
+        started_at = time.time()
+        try:
+            with _process_lock(MAINTENANCE_LOCK_PATH) as acquired:
+                if not acquired:
+                    result = {"status": "skipped", "reason": "Another process is running maintenance"}
+                else:
+                    with self.admission.admit("maintenance"):
+                        result = run_maintenance(self.embeddings, known_text_hashes=known_text_hashes)
+        except AdmissionRejected as e:
+            result = {"status": "deferred", "reason": f"Maintenance lane busy ({e.reason})"}
+        except Exception as e:
+            print(f"❌ Index maintenance failed: {e}")
+            result = {"status": "error", "error": str(e)}
+
+        result.update({"trigger": trigger, "started_at": started_at, "finished_at": time.time()})
+        print(f"🧹 Index maintenance ({trigger}): {result['status']}")
+        with self._lock:
+            self._last = result
+
+    def start(self, known_text_hashes=None, trigger="manual"):
+        """Starts a run in the background. Returns False if one is already running."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(
+                target=self._run, args=(known_text_hashes, trigger), name="index-maintenance", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def start_schedule(self):
+        """Runs maintenance every interval_hours on a daemon thread"""
+        if self.interval_hours <= 0:
+            return
+
+        def loop():
+            while True:
+                time.sleep(self.interval_hours * 3600)
+                self.start(trigger="scheduled")
+
+        threading.Thread(target=loop, name="index-maintenance-schedule", daemon=True).start()
+        print(f"✅ Index maintenance scheduled every {self.interval_hours:g} hours")
+
+    def status(self):
+        with self._lock:
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "interval_hours": self.interval_hours,
+                "last_run": self._last,
+            }
@@ -0,0 +1,143 @@
+import os
+import re
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from contextlib import contextmanager
+import numpy as np
+
+# --- Configuration ---
+NEAR_DUPLICATE_DB_PATH = "./near_duplicates.sqlite3"
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.85"))
+# "link": record the upload as a copy of the original and skip indexing; "flag": index it anyway but report the match
+NEAR_DUPLICATE_ACTION = os.getenv("NEAR_DUPLICATE_ACTION", "link")
+
+SHINGLE_WORDS = 5
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 32  # 32 bands x 4 rows: pairs above ~0.5 Jaccard almost always share a bucket
+MERSENNE_PRIME = (1 << 31) - 1
+SHINGLE_BLOCK = 8192
+
+_rng = np.random.RandomState(1729)
+_PERM_A = _rng.randint(1, MERSENNE_PRIME, size=MINHASH_PERMUTATIONS).astype(np.uint64)
+_PERM_B = _rng.randint(0, MERSENNE_PRIME, size=MINHASH_PERMUTATIONS).astype(np.uint64)
+
+
+def _shingle_hashes(text):
+    words = re.findall(r"\w+", unicodedata.normalize("NFKC", text).casefold())
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+    if len(words) < SHINGLE_WORDS:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles]
+    return np.array(hashes, dtype=np.uint64) % MERSENNE_PRIME
+
+
+def minhash_signature(text):
+    """MinHash signature over word 5-gram shingles; the share of equal slots estimates Jaccard similarity."""
+    hashes = _shingle_hashes(text)
+    signature = np.full(MINHASH_PERMUTATIONS, MERSENNE_PRIME, dtype=np.uint64)
+    for start in range(0, len(hashes), SHINGLE_BLOCK):
+        block = hashes[start:start + SHINGLE_BLOCK]
+        permuted = (_PERM_A[:, None] * block[None, :] + _PERM_B[:, None]) % MERSENNE_PRIME
+        signature = np.minimum(signature, permuted.min(axis=1))
+    return signature
+
+
+def _band_keys(signature):
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+    return [
+        hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8).hexdigest()
+        for band in range(LSH_BANDS)
+    ]
+
+
+class NearDuplicateIndex:
+    """Persistent MinHash/LSH index of ingested documents."""
+
+    def __init__(self, path=NEAR_DUPLICATE_DB_PATH, threshold=NEAR_DUPLICATE_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " text_hash TEXT PRIMARY KEY, title TEXT, signature BLOB,"
+                " duplicate_of TEXT, similarity REAL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS bands (band INTEGER, bucket TEXT, text_hash TEXT)")
+            conn.execute("CREATE INDEX IF NOT EXISTS bands_lookup ON bands (band, bucket)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def find_match(self, signature):
+        """Returns the most similar original document above threshold as a dict, or None."""
+        keys = _band_keys(signature)
+        with self._lock, self._connect() as conn:
+            candidates = set()
+            for band, bucket in enumerate(keys):
+                rows = conn.execute("SELECT text_hash FROM bands WHERE band = ? AND bucket = ?", (band, bucket))
+                candidates.update(row[0] for row in rows)
+
+            best = None
+            for text_hash in candidates:
+                title, stored = conn.execute(
+                    "SELECT title, signature FROM documents WHERE text_hash = ?", (text_hash,)
+                ).fetchone()
+                similarity = float(np.mean(np.frombuffer(stored, dtype=np.uint64) == signature))
+                if similarity >= self.threshold and (best is None or similarity > best["similarity"]):
+                    best = {"text_hash": text_hash, "title": title, "similarity": round(similarity, 4)}
+            return best
+
+    def add_original(self, text_hash, title, signature):
+        """Registers an indexed document so later uploads can match against it."""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM bands WHERE text_hash = ?", (text_hash,))
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (text_hash, title, signature, duplicate_of, similarity) VALUES (?, ?, ?, NULL, NULL)",
+                (text_hash, title, signature.tobytes()),
+            )
+            conn.executemany(
+                "INSERT INTO bands (band, bucket, text_hash) VALUES (?, ?, ?)",
+                [(band, bucket, text_hash) for band, bucket in enumerate(_band_keys(signature))],
+            )
+
+    def add_duplicate(self, text_hash, title, signature, original_text_hash, similarity):
+        """Records an upload as a copy of an original. Duplicates are not bucketed, so matches always resolve to originals."""
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (text_hash, title, signature, duplicate_of, similarity) VALUES (?, ?, ?, ?, ?)",
+                (text_hash, title, signature.tobytes(), original_text_hash, similarity),
+            )
+
+    def remove_documents(self, text_hashes):
+        """Forgets documents, so later uploads are no longer matched against them."""
+        if not text_hashes:
+            return
+        with self._lock, self._connect() as conn:
+            placeholders = ",".join("?" * len(text_hashes))
+            conn.execute(f"DELETE FROM bands WHERE text_hash IN ({placeholders})", list(text_hashes))
+            conn.execute(f"DELETE FROM documents WHERE text_hash IN ({placeholders})", list(text_hashes))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_near_duplicate_index():
+    """Returns the process-wide near-duplicate index, opening it on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = NearDuplicateIndex()
+        return _index
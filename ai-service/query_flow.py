@@ -0,0 +1,79 @@
+from contextlib import contextmanager, asynccontextmanager
+
+
+class CpuStep:
+    """A blocking step of a flow (embedding, vector search, the legacy chain), run as fn(*args)."""
+
+    def __init__(self, fn, *args):
+        self.fn = fn
+        self.args = args
+
+
+class ChatStep:
+    """A chat model call of a flow, run as chain.invoke(inputs) or awaited as chain.ainvoke(inputs)."""
+
+    def __init__(self, chain, inputs):
+        self.chain = chain
+        self.inputs = inputs
+
+
+# A flow is a generator that yields CpuStep and ChatStep objects, receives each step's result (or
+# has its exception raised at the yield) and returns the final value. The request logic is written
+# once as a flow; only the drivers below differ between the Flask and ASGI apps.
+# Drivers take an optional admit() returning a context manager that is held around each CpuStep only,
+# so an admission slot bounds CPU work and is never held while waiting on the chat model. If admit()
+# itself raises (e.g. the request is shed), the error leaves the driver instead of entering the flow.
+
+
+@contextmanager
+def _no_admission():
+    yield
+
+
+@asynccontextmanager
+async def _no_admission_async():
+    yield
+
+
+def run_flow(flow, admit=_no_admission):
+    """Drive a flow on the calling thread and return its result."""
+    result, error = None, None
+    while True:
+        try:
+            step = flow.throw(error) if error is not None else flow.send(result)
+        except StopIteration as done:
+            return done.value
+        result, error = None, None
+        if isinstance(step, ChatStep):
+            try:
+                result = step.chain.invoke(step.inputs)
+            except Exception as e:
+                error = e
+        else:
+            with admit():
+                try:
+                    result = step.fn(*step.args)
+                except Exception as e:
+                    error = e
+
+
+async def arun_flow(flow, run_blocking, admit=_no_admission_async):
+    """Drive a flow on the event loop, awaiting chat calls and running CPU steps with run_blocking(fn, *args)."""
+    result, error = None, None
+    while True:
+        try:
+            step = flow.throw(error) if error is not None else flow.send(result)
+        except StopIteration as done:
+            return done.value
+        result, error = None, None
+        if isinstance(step, ChatStep):
+            try:
+                result = await step.chain.ainvoke(step.inputs)
+            except Exception as e:
+                error = e
+        else:
+            async with admit():
+                try:
+                    result = await run_blocking(step.fn, *step.args)
+                except Exception as e:
+                    error = e
@@ -0,0 +1,139 @@
+import os
+from langchain.docstore.document import Document
+
+from embedding_worker import query_meter
+from lexical_index import exact_terms
+
+# --- Configuration ---
+# Smoothing constant for reciprocal-rank fusion; 60 is the value from the original RRF paper.
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+
+def embed_queries(embeddings, queries):
+    """Embeds all query variants in a single batched model call."""
+    # BGE models expect the retrieval instruction on queries but not on passages,
+    # so prepend it ourselves and go through the batched document path.
+    instruction = getattr(embeddings, "query_instruction", "") or ""
+    with query_meter.track(len(queries)):
+        return embeddings.embed_documents([instruction + query for query in queries])
+
+
+def search_by_vectors(store, vectors, k=5):
+    """
+    Runs the ANN searches for several query vectors in one collection call.
+    Returns one ranking per vector as a list of (chunk_id, Document, distance).
+    """
+    collection = getattr(store, "_collection", store)
+    if not vectors or collection.count() == 0:
+        return [[] for _ in vectors]
+
+    results = collection.query(
+        query_embeddings=vectors,
+        n_results=k,
+        include=["documents", "metadatas", "distances"],
+    )
+
+    rankings = []
+    for ids, documents, metadatas, distances in zip(
+        results["ids"], results["documents"], results["metadatas"], results["distances"]
+    ):
+        rankings.append([
+            (chunk_id, Document(page_content=text, metadata=metadata or {}), distance)
+            for chunk_id, text, metadata, distance in zip(ids, documents, metadatas, distances)
+        ])
+    return rankings
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Fuses several rankings of (chunk_id, Document, ...) into one, deduplicating by chunk id.
+    Returns a list of (chunk_id, Document, fused_score) ordered best first.
+    """
+    scores = {}
+    documents = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking):
+            chunk_id, doc = hit[0], hit[1]
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank + 1)
+            documents.setdefault(chunk_id, doc)
+
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [(chunk_id, documents[chunk_id], scores[chunk_id]) for chunk_id in ordered]
+
+
+def multi_query_search(store, embeddings, queries, k=5):
+    """
+    Retrieves for several query variants with one embedding pass and one vector search,
+    then fuses the rankings. Returns a list of (chunk_id, Document, fused_score).
+    """
+    variants = []
+    for query in queries:
+        query = (query or "").strip()
+        if query and query not in variants:
+            variants.append(query)
+    if not variants or store is None:
+        return []
+
+    vectors = embed_queries(embeddings, variants)
+    rankings = search_by_vectors(store, vectors, k=k)
+    return reciprocal_rank_fusion(rankings)[:k]
+
+
+def fetch_by_ids(store, chunk_ids):
+    """Loads chunks by id without any embedding or vector search, preserving the given order."""
+    if store is None or not chunk_ids:
+        return []
+    collection = getattr(store, "_collection", store)
+    results = collection.get(ids=list(chunk_ids), include=["documents", "metadatas"])
+
+    found = {
+        chunk_id: Document(page_content=text, metadata=metadata or {})
+        for chunk_id, text, metadata in zip(results["ids"], results["documents"], results["metadatas"])
+    }
+    return [(chunk_id, found[chunk_id]) for chunk_id in chunk_ids if chunk_id in found]
+
+
+def similarity_from_distance(distance):
+    """Cosine similarity from Chroma's default squared-L2 distance (exact for normalized embeddings)."""
+    return 1.0 - distance / 2.0
+
+
+def scored_search(store, vector, k=5):
+    """Searches one collection with an already embedded query. Returns (chunk_id, Document, similarity), best first."""
+    if store is None:
+        return []
+    (ranking,) = search_by_vectors(store, [vector], k=k)
+    return [(chunk_id, doc, similarity_from_distance(distance)) for chunk_id, doc, distance in ranking]
+
+
+def lexical_search(store, lexical_index, query, k=5, required_terms=()):
+    """
+    BM25 search in the lexical index, loading the matching chunks from the store by id.
+    No embedding pass. Returns (chunk_id, Document, bm25_score), best first.
+    """
+    if store is None or lexical_index is None:
+        return []
+    ranked = lexical_index.search(query, k=k, required_terms=required_terms)
+    scores = dict(ranked)
+    return [(chunk_id, doc, scores[chunk_id]) for chunk_id, doc in fetch_by_ids(store, [chunk_id for chunk_id, _ in ranked])]
+
+
+def hybrid_search(store, embeddings, lexical_index, query, k=5, variants=(), allow_lexical_only=True):
+    """
+    Exact-term queries (course codes, question numbers) are answered from the lexical index
+    alone when every code-like term matches, unless allow_lexical_only is False (platform
+    questions). Other queries fuse the dense ranking of the query and its variants (one
+    batched embedding pass) with the BM25 ranking of the query.
+    Returns a list of (chunk_id, Document, score).
+    """
+    if store is None:
+        return []
+    required = exact_terms(query) if allow_lexical_only else []
+    if required:
+        hits = lexical_search(store, lexical_index, query, k=k, required_terms=required)
+        if hits:
+            return hits
+
+    dense = multi_query_search(store, embeddings, [query, *variants], k=k)
+    lexical = lexical_search(store, lexical_index, query, k=k)
+    return reciprocal_rank_fusion([dense, lexical])[:k]
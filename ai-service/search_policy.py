@@ -0,0 +1,73 @@
+import os
+import threading
+
+# --- Configuration ---
+# Scores are cosine similarities between the query and a chunk, from normalized BGE embeddings.
+# Hits below the relevance threshold are never used as context.
+SEARCH_RELEVANCE_THRESHOLD = float(os.getenv("SEARCH_RELEVANCE_THRESHOLD", "0.60"))
+# A top hit at or above the decisive score settles the query, so the other collection is not searched.
+SEARCH_DECISIVE_SCORE = float(os.getenv("SEARCH_DECISIVE_SCORE", "0.80"))
+# Set to 0 to always search both collections; scores are still used to filter context.
+SEARCH_SHORT_CIRCUIT = os.getenv("SEARCH_SHORT_CIRCUIT", "1") != "0"
+
+COLLECTIONS = ["system", "user"]
+
+
+class SearchPolicy:
+    """Decides the order of the system and user document searches, and when the second one can be skipped."""
+
+    def __init__(self, relevance_threshold=SEARCH_RELEVANCE_THRESHOLD, decisive_score=SEARCH_DECISIVE_SCORE,
+                 short_circuit=SEARCH_SHORT_CIRCUIT):
+        self.relevance_threshold = relevance_threshold
+        self.decisive_score = decisive_score
+        self.short_circuit = short_circuit
+
+    def search_order(self, platform_first):
+        return ["system", "user"] if platform_first else ["user", "system"]
+
+    def relevant(self, hits):
+        """Drops (chunk_id, doc, similarity) hits that score below the relevance threshold."""
+        return [hit for hit in hits if hit[2] >= self.relevance_threshold]
+
+    def is_decisive(self, hits):
+        return self.short_circuit and bool(hits) and hits[0][2] >= self.decisive_score
+
+
+class SearchMetrics:
+    """Counts the collection searches run and avoided by the policy."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queries = 0
+        self._without_context = 0
+        self._lexical_only = 0
+        self._counters = {name: {"searched": 0, "skipped": 0} for name in COLLECTIONS}
+
+    def record(self, searched, skipped, has_context, lexical_only=False):
+        with self._lock:
+            self._queries += 1
+            if lexical_only:
+                self._lexical_only += 1
+            if not has_context:
+                self._without_context += 1
+            for name in searched:
+                self._counters[name]["searched"] += 1
+            for name in skipped:
+                self._counters[name]["skipped"] += 1
+
+    def stats(self):
+        with self._lock:
+            avoided = sum(counter["skipped"] for counter in self._counters.values())
+            return {
+                "queries": self._queries,
+                "searches_avoided": avoided,
+                # Answered from general knowledge because nothing scored above the relevance threshold
+                "queries_without_context": self._without_context,
+                # Exact-term queries answered from the lexical index with no embedding pass
+                "lexical_only_queries": self._lexical_only,
+                "collections": {name: dict(counter) for name, counter in self._counters.items()},
+            }
+
+
+# Shared across knowledge manager rebuilds, so the counters cover the whole process lifetime.
+search_metrics = SearchMetrics()
@@ -0,0 +1,122 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# --- Configuration ---
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "1000"))
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "4"))
+SESSION_ANSWER_CHARS = 300
+FOLLOW_UP_MAX_WORDS = 12
+
+# Words that point back at the previous turn rather than introduce a new topic.
+FOLLOW_UP_MARKERS = {
+    "that", "this", "it", "those", "these", "them", "above", "previous", "again",
+    "more", "simpler", "simply", "elaborate", "expand", "clarify", "example",
+    "examples", "further", "continue", "shorter", "detail",
+}
+
+# Words that carry no topic of their own. Any other word in a follow-up must already appear
+# in the session's recent turns, otherwise the query introduces a new topic.
+FOLLOW_UP_FILLER = FOLLOW_UP_MARKERS | {
+    "a", "an", "the", "and", "or", "but", "so", "of", "to", "in", "on", "for", "with", "about",
+    "as", "at", "by", "from", "into", "is", "are", "was", "were", "be", "been", "do", "does",
+    "did", "can", "could", "would", "will", "should", "may", "might", "i", "me", "my", "you",
+    "your", "we", "us", "he", "she", "they", "what", "why", "how", "which", "who", "when",
+    "where", "please", "tell", "explain", "give", "show", "say", "said", "mean", "means",
+    "meant", "bit", "little", "some", "one", "part", "point", "way", "other", "another",
+    "same", "just", "also", "too", "very", "much", "terms", "words", "step", "steps",
+    "details", "detailed", "simple", "easier", "short", "summary", "summarize", "re", "s", "t",
+    "don't", "didn't", "isn't", "what's", "that's", "it's",
+}
+
+class SessionStore:
+    """Bounded, TTL-evicted in-process store of recent conversation context per session."""
+
+    def __init__(self, max_sessions=SESSION_MAX_ENTRIES, ttl_seconds=SESSION_TTL_SECONDS, max_turns=SESSION_MAX_TURNS):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_turns = max_turns
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict_expired(self, now):
+        # Entries are kept in least-recently-updated order, so expired ones sit at the front.
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session["updated_at"] < self.ttl_seconds:
+                break
+            del self._sessions[session_id]
+
+    def get(self, session_id):
+        """Returns a snapshot of the session, or None if it is unknown or expired."""
+        if not session_id:
+            return None
+        with self._lock:
+            self._evict_expired(time.time())
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            return {
+                "summary": session["summary"],
+                "chunk_ids": dict(session["chunk_ids"]),
+                "intent": session["intent"],
+            }
+
+    def record_turn(self, session_id, query, answer, intent=None, chunk_ids=None):
+        """Appends a turn to the rolling summary and, if given, replaces the cached chunk ids."""
+        if not session_id:
+            return
+        now = time.time()
+        with self._lock:
+            self._evict_expired(now)
+            session = self._sessions.pop(session_id, None) or {
+                "turns": [],
+                "summary": "",
+                "chunk_ids": {},
+                "intent": None,
+            }
+
+            answer = (answer or "").strip()
+            if len(answer) > SESSION_ANSWER_CHARS:
+                answer = answer[:SESSION_ANSWER_CHARS] + "..."
+            session["turns"] = (session["turns"] + [(query, answer)])[-self.max_turns:]
+            session["summary"] = "\n".join(
+                f"Student: {turn_query}\nAssistant: {turn_answer}" for turn_query, turn_answer in session["turns"]
+            )
+            if chunk_ids is not None:
+                session["chunk_ids"] = chunk_ids
+            if intent is not None:
+                session["intent"] = intent
+            session["updated_at"] = now
+
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+def _stem(word):
+    return word[:-1] if len(word) > 3 and word.endswith("s") else word
+
+
+def is_follow_up_query(query, session):
+    """
+    Heuristic: a short query that refers back to the previous turns of a session with cached
+    context and introduces no new topic, i.e. it has a reference word and every other content
+    word already appears in the recent turns.
+    """
+    if not session or not any(session["chunk_ids"].values()):
+        return False
+    words = re.findall(r"[a-z']+", query.lower())
+    if not words or len(words) > FOLLOW_UP_MAX_WORDS:
+        return False
+    if not any(word in FOLLOW_UP_MARKERS for word in words):
+        return False
+    history = {_stem(word) for word in re.findall(r"[a-z']+", session["summary"].lower())}
+    return all(_stem(word) in history for word in words if word not in FOLLOW_UP_FILLER)
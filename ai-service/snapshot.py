@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import struct
+import numpy as np
+
+from embedding_backends import embedding_fingerprint
+
+# --- Configuration ---
+INDEX_SNAPSHOT_PATH = os.getenv("INDEX_SNAPSHOT_PATH", "./index_snapshot.bin")
+SNAPSHOT_MAGIC = b"SCHSNAP\x00"
+SNAPSHOT_FORMAT_VERSION = 2
+# Version 1 snapshots carry no bundled files, and are still loaded
+SUPPORTED_FORMAT_VERSIONS = (1, 2)
+SNAPSHOT_ALIGNMENT = 64
+EXPORT_PAGE_SIZE = 1000
+
+# File layout:
+#   8 bytes   magic
+#   8 bytes   little-endian header length
+#   N bytes   JSON header (format version, embedding fingerprint, per-collection ids/documents/metadatas
+#             and the offset of each collection's vectors, offset and size of each bundled file)
+#   padding   up to a 64-byte boundary
+#   float32   one row-major (count x dim) matrix per collection, each 64-byte aligned
+#   bytes     each bundled file (the FAQ answer table, the lexical index), each 64-byte aligned
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot is malformed or was built with a different embedding model."""
+
+
+def _read_collection(collection):
+    ids, documents, metadatas, vectors = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(
+            include=["embeddings", "documents", "metadatas"],
+            limit=EXPORT_PAGE_SIZE,
+            offset=offset,
+        )
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        documents.extend(page["documents"])
+        metadatas.extend(page["metadatas"])
+        vectors.extend(page["embeddings"])
+        offset += len(page["ids"])
+    return ids, documents, metadatas, vectors
+
+
+def _aligned(position):
+    return (position + SNAPSHOT_ALIGNMENT - 1) // SNAPSHOT_ALIGNMENT * SNAPSHOT_ALIGNMENT
+
+
+def export_snapshot(stores, embeddings, path=INDEX_SNAPSHOT_PATH, files=None):
+    """
+    Writes the given {name: Chroma store} collections, and the {name: file path} files bundled with
+    them, into one snapshot file. The file is written next to the target and renamed into place, so
+    readers never see a partial snapshot.
+    """
+    collections = {}
+    matrices = []
+    for name, store in stores.items():
+        if store is None:
+            continue
+        collection = getattr(store, "_collection", store)
+        ids, documents, metadatas, vectors = _read_collection(collection)
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1) if ids else np.zeros((0, 0), dtype=np.float32)
+        collections[name] = {
+            "count": len(ids),
+            "dim": int(matrix.shape[1]),
+            "ids": ids,
+            "documents": documents,
+            "metadatas": metadatas,
+        }
+        matrices.append((name, matrix))
+
+    bundled = {}
+    blobs = []
+    for name, file_path in (files or {}).items():
+        with open(file_path, "rb") as f:
+            blob = f.read()
+        bundled[name] = {"bytes": len(blob), "offset": 0}
+        blobs.append((name, blob))
+
+    header = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "created_at": int(time.time()),
+        "embedding_fingerprint": embedding_fingerprint(embeddings),
+        "collections": collections,
+        "files": bundled,
+    }
+
+    # The offsets live in the header itself, so recompute them until the header size settles
+    for name, _ in matrices:
+        collections[name]["vectors_offset"] = 0
+    while True:
+        header_bytes = json.dumps(header).encode("utf-8")
+        position = _aligned(len(SNAPSHOT_MAGIC) + 8 + len(header_bytes))
+        offsets, file_offsets = {}, {}
+        for name, matrix in matrices:
+            offsets[name] = position
+            position = _aligned(position + matrix.nbytes)
+        for name, blob in blobs:
+            file_offsets[name] = position
+            position = _aligned(position + len(blob))
+        if all(collections[name]["vectors_offset"] == offset for name, offset in offsets.items()) and \
+                all(bundled[name]["offset"] == offset for name, offset in file_offsets.items()):
+            break
+        for name, offset in offsets.items():
+            collections[name]["vectors_offset"] = offset
+        for name, offset in file_offsets.items():
+            bundled[name]["offset"] = offset
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for name, matrix in matrices:
+            f.write(b"\x00" * (collections[name]["vectors_offset"] - f.tell()))
+            f.write(matrix.tobytes())
+        for name, blob in blobs:
+            f.write(b"\x00" * (bundled[name]["offset"] - f.tell()))
+            f.write(blob)
+    os.replace(tmp_path, path)
+
+    size = os.path.getsize(path)
+    print(f"✅ Exported index snapshot to {path} ({size / 1e6:.1f} MB, {sum(c['count'] for c in collections.values())} chunks)")
+    return {
+        "path": path,
+        "bytes": size,
+        "collections": {name: c["count"] for name, c in collections.items()},
+        "files": sorted(bundled),
+    }
+
+
+class SnapshotCollection:
+    """
+    Read-only, memory-mapped collection from a snapshot. It implements the subset of the Chroma
+    collection API used by retrieval.py (count, query, get), with Chroma's default squared-L2 distances.
+    """
+
+    def __init__(self, path, info):
+        self.ids = info["ids"]
+        self.documents = info["documents"]
+        self.metadatas = info["metadatas"]
+        self._positions = {chunk_id: i for i, chunk_id in enumerate(self.ids)}
+        if info["count"]:
+            self.vectors = np.memmap(path, dtype=np.float32, mode="r", offset=info["vectors_offset"], shape=(info["count"], info["dim"]))
+        else:
+            self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self._sq_norms = None
+
+    def count(self):
+        return len(self.ids)
+
+    def _rows(self, positions, include):
+        result = {"ids": [self.ids[i] for i in positions]}
+        if "documents" in include:
+            result["documents"] = [self.documents[i] for i in positions]
+        if "metadatas" in include:
+            result["metadatas"] = [self.metadatas[i] for i in positions]
+        if "embeddings" in include:
+            result["embeddings"] = [self.vectors[i].tolist() for i in positions]
+        return result
+
+    def query(self, query_embeddings, n_results=10, include=("documents", "metadatas", "distances")):
+        if self._sq_norms is None:
+            self._sq_norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        # Squared L2: |v|^2 + |q|^2 - 2 v.q, computed for all queries in one matrix product
+        distances = self._sq_norms[None, :] + np.einsum("ij,ij->i", queries, queries)[:, None] - 2.0 * (queries @ self.vectors.T)
+
+        k = min(n_results, self.count())
+        results = {key: [] for key in ["ids", "documents", "metadatas", "distances"]}
+        for row in distances:
+            top = np.argpartition(row, k - 1)[:k] if k < len(row) else np.arange(len(row))
+            top = top[np.argsort(row[top])]
+            rows = self._rows(top, include)
+            results["ids"].append(rows["ids"])
+            results["documents"].append(rows.get("documents"))
+            results["metadatas"].append(rows.get("metadatas"))
+            results["distances"].append([float(row[i]) for i in top])
+        return results
+
+    def get(self, ids=None, include=("documents", "metadatas"), limit=None, offset=None):
+        if ids is None:
+            positions = list(range(self.count()))[offset or 0:]
+            positions = positions[:limit] if limit is not None else positions
+        else:
+            positions = [self._positions[chunk_id] for chunk_id in ids if chunk_id in self._positions]
+        return self._rows(positions, include)
+
+
+def _read_header(path):
+    with open(path, "rb") as f:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise SnapshotError(f"{path} is not an index snapshot")
+        (header_length,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_length).decode("utf-8"))
+    if header.get("format_version") not in SUPPORTED_FORMAT_VERSIONS:
+        raise SnapshotError(f"Unsupported snapshot format version {header.get('format_version')}")
+    return header
+
+
+def load_snapshot(embeddings, path=INDEX_SNAPSHOT_PATH):
+    """
+    Memory-maps a snapshot and returns {name: SnapshotCollection}, or None if there is no snapshot.
+    Refuses snapshots built with a different embedding model.
+    """
+    if not path or not os.path.exists(path):
+        return None
+
+    header = _read_header(path)
+    if header.get("embedding_fingerprint") != embedding_fingerprint(embeddings):
+        raise SnapshotError(
+            f"Snapshot was built with {header.get('embedding_fingerprint')}, "
+            f"but the service uses {embedding_fingerprint(embeddings)}"
+        )
+
+    collections = {name: SnapshotCollection(path, info) for name, info in header["collections"].items()}
+    print(f"✅ Memory-mapped index snapshot {path} ({', '.join(f'{n}: {c.count()}' for n, c in collections.items())})")
+    return collections
+
+
+def restore_snapshot_files(targets, path=INDEX_SNAPSHOT_PATH):
+    """
+    Writes the files bundled in a snapshot to targets {name: file path}, skipping targets that already
+    exist, so a fresh node starts with them instead of rebuilding them. Returns the names restored.
+    """
+    if not path or not os.path.exists(path):
+        return []
+    bundled = _read_header(path).get("files", {})
+    restored = []
+    with open(path, "rb") as f:
+        for name, target in targets.items():
+            if name not in bundled or os.path.exists(target):
+                continue
+            f.seek(bundled[name]["offset"])
+            blob = f.read(bundled[name]["bytes"])
+            with open(f"{target}.tmp", "wb") as out:
+                out.write(blob)
+            os.replace(f"{target}.tmp", target)
+            restored.append(name)
+    return restored
+
+
+def import_snapshot_collection(snapshot_collection, store, batch_size=EXPORT_PAGE_SIZE):
+    """Copies a snapshot collection into a writable Chroma store using the stored vectors (no re-embedding)."""
+    collection = getattr(store, "_collection", store)
+    for start in range(0, snapshot_collection.count(), batch_size):
+        end = min(start + batch_size, snapshot_collection.count())
+        collection.add(
+            ids=snapshot_collection.ids[start:end],
+            embeddings=snapshot_collection.vectors[start:end].tolist(),
+            documents=snapshot_collection.documents[start:end],
+            metadatas=snapshot_collection.metadatas[start:end],
+        )
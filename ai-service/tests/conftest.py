@@ -0,0 +1,76 @@
+import os
+import re
+import sys
+import hashlib
+
+import pytest
+
+# The service modules are imported as top-level modules, the way main.py imports them
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+FAKE_DIM = 64
+
+
+class FakeEmbeddings:
+    """Deterministic bag-of-words embeddings, normalized like BGE's, that count model calls."""
+
+    query_instruction = ""
+    encode_kwargs = {"normalize_embeddings": True}
+
+    def __init__(self, model_name="fake-embeddings"):
+        self.model_name = model_name
+        self.calls = 0
+        self.texts = 0
+
+    def _vector(self, text):
+        vector = [0.0] * FAKE_DIM
+        for word in re.findall(r"\w+", text.lower()):
+            vector[int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % FAKE_DIM] += 1.0
+        norm = sum(x * x for x in vector) ** 0.5 or 1.0
+        return [x / norm for x in vector]
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+@pytest.fixture
+def make_embeddings():
+    return FakeEmbeddings
+
+
+@pytest.fixture
+def fake_embeddings():
+    return FakeEmbeddings()
+
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch, fake_embeddings):
+    """
+    Runs a test in an empty working directory, where every relative store path (chroma_db, the
+    lexical index, the manifest, ...) is fresh, with the process-wide singletons reset and
+    ingestion embedding inline.
+    """
+    pytest.importorskip("chromadb")
+    pytest.importorskip("langchain_community")
+    import chromadb
+    import embedding_worker
+    import lexical_index
+    import near_duplicates
+    import ingestion_manifest
+
+    monkeypatch.chdir(tmp_path)
+    for module in (lexical_index, near_duplicates):
+        monkeypatch.setattr(module, "_index", None)
+    monkeypatch.setattr(ingestion_manifest, "_manifest", None)
+    monkeypatch.setattr(
+        embedding_worker, "_ingestion_pool", embedding_worker.IngestionEmbeddingPool(fake_embeddings, workers=0)
+    )
+    # Chroma caches one client system per persist path, and "./chroma_db" is the same string in every test
+    chromadb.api.client.SharedSystemClient.clear_system_cache()
+    yield tmp_path
+    chromadb.api.client.SharedSystemClient.clear_system_cache()
@@ -0,0 +1,136 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def controller(**overrides):
+    config = {
+        "high": {"max_concurrency": 1, "max_queue": 1, "queue_timeout": 5},
+        "low": {"max_concurrency": 1, "max_queue": 1, "queue_timeout": 5},
+    }
+    for lane, values in overrides.items():
+        config[lane].update(values)
+    return AdmissionController(lane_config=config, lane_order=["high", "low"])
+
+
+def wait_until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def admit_in_thread(admission, lane, release, admitted):
+    def run():
+        with admission.admit(lane):
+            admitted.append(lane)
+            release.wait(2)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_full_queue_is_rejected_with_429():
+    admission = controller()
+    release, admitted = threading.Event(), []
+    with admission.admit("high"):
+        waiter = admit_in_thread(admission, "high", release, admitted)
+        wait_until(lambda: admission.stats()["high"]["queued"] == 1)
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            with admission.admit("high"):
+                pass
+    release.set()
+    waiter.join(2)
+
+    assert rejected.value.status == 429
+    assert rejected.value.reason == "queue_full"
+    assert rejected.value.retry_after >= 1
+    assert admitted == ["high"]
+    assert admission.stats()["high"]["rejected_full"] == 1
+
+
+def test_queue_timeout_is_rejected_with_503():
+    admission = controller(high={"queue_timeout": 0.05})
+    with admission.admit("high"):
+        with pytest.raises(AdmissionRejected) as rejected:
+            with admission.admit("high"):
+                pass
+
+    assert rejected.value.status == 503
+    assert rejected.value.reason == "queue_timeout"
+    assert admission.stats()["high"]["rejected_timeout"] == 1
+    assert admission.stats()["high"]["queued"] == 0
+
+
+def test_lower_lane_waits_while_a_higher_lane_has_queued_work():
+    admission = controller(low={"queue_timeout": 0.05})
+    release, admitted = threading.Event(), []
+    with admission.admit("high"):
+        waiter = admit_in_thread(admission, "high", release, admitted)
+        wait_until(lambda: admission.stats()["high"]["queued"] == 1)
+
+        # The low lane is idle, but strict priority keeps it from starting
+        with pytest.raises(AdmissionRejected) as rejected:
+            with admission.admit("low"):
+                pass
+    assert rejected.value.status == 503
+
+    wait_until(lambda: admitted == ["high"])
+    with admission.admit("low"):
+        pass
+    release.set()
+    waiter.join(2)
+
+
+def test_freed_lower_lane_slot_stays_idle_while_a_higher_lane_has_queued_work():
+    admission = controller()
+    release, admitted = threading.Event(), []
+    with admission.admit("high"):
+        with admission.admit("low"):
+            low = admit_in_thread(admission, "low", release, admitted)
+            wait_until(lambda: admission.stats()["low"]["queued"] == 1)
+            high = admit_in_thread(admission, "high", release, admitted)
+            wait_until(lambda: admission.stats()["high"]["queued"] == 1)
+
+        # Releasing the low slot dispatches synchronously, and the queued high request blocks it
+        assert admission.stats()["low"]["running"] == 0
+        assert admission.stats()["low"]["queued"] == 1
+        assert admitted == []
+    wait_until(lambda: sorted(admitted) == ["high", "low"])
+    release.set()
+    low.join(2)
+    high.join(2)
+
+
+def test_lower_lane_waits_while_a_higher_lane_is_at_its_busy_fraction():
+    admission = controller(high={"max_concurrency": 4, "busy_fraction": 0.5})
+    release, admitted = threading.Event(), []
+    with admission.admit("high"):
+        with admission.admit("high"):
+            # Two of four high slots are in flight and nothing is queued, yet the low lane yields
+            low = admit_in_thread(admission, "low", release, admitted)
+            wait_until(lambda: admission.stats()["low"]["queued"] == 1)
+            assert admitted == []
+
+        # Dropping below the busy fraction dispatches the waiting low request
+        wait_until(lambda: admitted == ["low"])
+    release.set()
+    low.join(2)
+
+
+def test_lane_without_a_busy_fraction_only_blocks_by_queueing():
+    admission = controller(high={"max_concurrency": 2})
+    with admission.admit("high"):
+        with admission.admit("high"):
+            with admission.admit("low"):
+                assert admission.stats()["low"]["running"] == 1
+
+
+def test_unknown_lane_is_an_error():
+    with pytest.raises(ValueError):
+        with controller().admit("batch"):
+            pass
@@ -0,0 +1,82 @@
+import json
+import random
+
+import pytest
+
+
+def essay(seed, words=600):
+    rng = random.Random(seed)
+    return " ".join(f"term{rng.randrange(5000)}" for _ in range(words))
+
+
+@pytest.fixture
+def create(index_dir):
+    import create
+    return create
+
+
+def stored(create, embeddings):
+    collection = create.get_chroma_db(embeddings)._collection
+    return collection.get(include=["documents", "metadatas"])
+
+
+def test_chunks_are_stored_under_their_content_address(create, fake_embeddings):
+    summary = create.process_document_and_add_to_db("Optics", essay(1), "h-optics", fake_embeddings)
+
+    result = stored(create, fake_embeddings)
+    assert summary["status"] == "indexed"
+    assert summary["new_chunks"] == len(result["ids"])
+    assert result["ids"] == [create.chunk_id_for(text) for text in result["documents"]]
+
+
+def test_shared_chunks_are_linked_instead_of_embedded_again(create, fake_embeddings):
+    # Two documents that are mostly different but share one paragraph
+    shared = essay(99, words=150)
+    create.process_document_and_add_to_db("Optics", shared + "\n\n" + essay(1), "h-optics", fake_embeddings)
+    embedded_before = fake_embeddings.texts
+
+    summary = create.process_document_and_add_to_db("Lenses", shared + "\n\n" + essay(2), "h-lenses", fake_embeddings)
+
+    assert summary["status"] == "indexed"
+    assert summary["deduplicated_chunks"] >= 1
+    assert fake_embeddings.texts - embedded_before == summary["new_chunks"]
+    linked = [metadata for metadata in stored(create, fake_embeddings)["metadatas"] if metadata["source_count"] == 2]
+    assert len(linked) == summary["deduplicated_chunks"]
+    for metadata in linked:
+        assert json.loads(metadata["sources"]) == ["Optics", "Lenses"]
+        assert json.loads(metadata["text_hashes"]) == ["h-optics", "h-lenses"]
+
+
+def test_near_duplicate_upload_is_linked_to_the_original_without_embedding(create, fake_embeddings):
+    original = essay(1)
+    create.process_document_and_add_to_db("Optics", original, "h-optics", fake_embeddings)
+    embedded_before = fake_embeddings.texts
+
+    summary = create.process_document_and_add_to_db("Optics (copy)", original + " term1", "h-copy", fake_embeddings)
+
+    assert summary["status"] == "near_duplicate"
+    assert summary["duplicate_of"] == {"title": "Optics", "text_hash": "h-optics"}
+    assert fake_embeddings.texts == embedded_before
+    for metadata in stored(create, fake_embeddings)["metadatas"]:
+        assert "h-copy" in json.loads(metadata["text_hashes"])
+
+
+def test_re_upload_is_reported_as_already_indexed(create, fake_embeddings):
+    create.process_document_and_add_to_db("Optics", essay(1), "h-optics", fake_embeddings)
+
+    summary = create.process_document_and_add_to_db("Optics", essay(1), "h-optics", fake_embeddings)
+
+    assert summary["status"] == "already_indexed"
+    assert summary["indexed_as"] == {"title": "Optics", "text_hash": "h-optics"}
+
+
+def test_near_duplicate_is_indexed_normally_when_the_original_chunks_are_gone(create, fake_embeddings):
+    original = essay(1)
+    create.process_document_and_add_to_db("Optics", original, "h-optics", fake_embeddings)
+    collection = create.get_chroma_db(fake_embeddings)._collection
+    collection.delete(ids=collection.get()["ids"][:1])
+
+    summary = create.process_document_and_add_to_db("Optics (copy)", original + " term1", "h-copy", fake_embeddings)
+
+    assert summary["status"] == "indexed"
+    assert summary["near_duplicate_of"]["text_hash"] == "h-optics"
@@ -0,0 +1,47 @@
+from lexical_index import LexicalIndex, exact_terms
+
+
+def build_index(tmp_path):
+    index = LexicalIndex(path=str(tmp_path / "lexical.sqlite3"))
+    index.add_chunks(
+        ["pyq-2019", "pyq-2020", "notes", "syllabus"],
+        [
+            "PYQ 2019 Q4b: derive the lens formula. Q4a: define focal length.",
+            "PYQ 2020 Q4b: state Snell's law.",
+            "Lens formula notes with worked examples of the lens formula.",
+            "CS101 syllabus: variables, loops and functions.",
+        ],
+    )
+    return index
+
+
+def test_required_terms_filter_the_ranking(tmp_path):
+    index = build_index(tmp_path)
+
+    assert [chunk_id for chunk_id, _ in index.search("PYQ 2019 Q4b", required_terms=["2019", "q4b"])] == ["pyq-2019"]
+    assert {chunk_id for chunk_id, _ in index.search("PYQ Q4b", required_terms=["q4b"])} == {"pyq-2019", "pyq-2020"}
+    assert index.search("PYQ 2021 Q4b", required_terms=["2021", "q4b"]) == []
+
+
+def test_bm25_ranks_the_denser_match_first(tmp_path):
+    index = build_index(tmp_path)
+
+    ranked = index.search("lens formula")
+    assert ranked[0][0] == "notes"
+    assert {chunk_id for chunk_id, _ in ranked} == {"notes", "pyq-2019"}
+
+
+def test_chunks_are_indexed_once_and_can_be_removed(tmp_path):
+    index = build_index(tmp_path)
+    assert index.add_chunks(["notes"], ["Lens formula notes"]) == 0
+
+    index.remove_chunks(["syllabus"])
+    assert index.count() == 3
+    assert index.search("CS101", required_terms=["cs101"]) == []
+
+
+def test_exact_terms_only_counts_code_shaped_terms():
+    assert exact_terms("PYQ 2019 Q4b") == ["2019", "q4b"]
+    assert exact_terms("CS101 notes") == ["cs101"]
+    assert exact_terms("notes from 2019") == []
+    assert exact_terms("how do I upload a file bigger than 10 MB") == []
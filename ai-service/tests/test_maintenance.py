@@ -0,0 +1,116 @@
+import json
+import random
+
+import pytest
+
+
+def essay(seed, words=600):
+    rng = random.Random(seed)
+    return " ".join(f"term{rng.randrange(5000)}" for _ in range(words))
+
+
+@pytest.fixture
+def maintenance(index_dir, monkeypatch, fake_embeddings):
+    import embedding_worker
+    import maintenance
+
+    # Small batches, so a failure can leave an ingestion half written
+    monkeypatch.setattr(
+        embedding_worker, "_ingestion_pool", embedding_worker.IngestionEmbeddingPool(fake_embeddings, workers=0, batch_size=2)
+    )
+    return maintenance
+
+
+def collection(embeddings):
+    import create
+    return create.get_chroma_db(embeddings)._collection
+
+
+def sources_by_id(embeddings):
+    stored = collection(embeddings).get(include=["metadatas"])
+    return {chunk_id: json.loads(metadata["text_hashes"]) for chunk_id, metadata in zip(stored["ids"], stored["metadatas"])}
+
+
+def test_failed_ingestion_is_rolled_back_keeping_chunks_other_documents_share(maintenance, fake_embeddings, monkeypatch):
+    import create
+    from ingestion_manifest import get_ingestion_manifest
+
+    shared = essay(99, words=150)
+    create.process_document_and_add_to_db("Optics", shared + "\n\n" + essay(1), "h-optics", fake_embeddings)
+    before = sources_by_id(fake_embeddings)
+
+    write_chunks, calls = create._write_chunks, []
+
+    def fail_on_second_batch(*args):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("embedding worker died")
+        return write_chunks(*args)
+    monkeypatch.setattr(create, "_write_chunks", fail_on_second_batch)
+    with pytest.raises(RuntimeError):
+        create.process_document_and_add_to_db("Lenses", shared + "\n\n" + essay(2), "h-lenses", fake_embeddings)
+    monkeypatch.setattr(create, "_write_chunks", write_chunks)
+    assert len(sources_by_id(fake_embeddings)) > len(before)
+
+    report = maintenance.run_maintenance(fake_embeddings)
+
+    assert report["rolled_back_documents"] == ["Lenses"]
+    assert report["removed_chunks"]["half_ingested"] > 0
+    assert sources_by_id(fake_embeddings) == before
+    assert get_ingestion_manifest().get("h-lenses")["status"] == "rolled_back"
+    assert report["integrity"]["mismatched"] == []
+
+
+def test_duplicate_chunks_are_merged_into_the_content_addressed_copy(maintenance, fake_embeddings):
+    import create
+
+    create.process_document_and_add_to_db("Optics", essay(1), "h-optics", fake_embeddings)
+    store = collection(fake_embeddings)
+    kept = store.get(limit=1, include=["documents", "embeddings"])
+    # A copy stored under a legacy random id by another document, before chunks were content-addressed
+    store.add(
+        ids=["legacy-uuid"], embeddings=kept["embeddings"], documents=kept["documents"],
+        metadatas=[{"source": "Optics notes", "text_hash": "h-notes"}],
+    )
+
+    report = maintenance.run_maintenance(fake_embeddings)
+
+    assert report["removed_chunks"]["duplicate"] == 1
+    merged = sources_by_id(fake_embeddings)
+    assert "legacy-uuid" not in merged
+    assert merged[kept["ids"][0]] == ["h-optics", "h-notes"]
+
+
+def test_documents_missing_from_known_text_hashes_are_removed(maintenance, fake_embeddings):
+    import create
+
+    create.process_document_and_add_to_db("Optics", essay(1), "h-optics", fake_embeddings)
+    create.process_document_and_add_to_db("Deleted", essay(2), "h-deleted", fake_embeddings)
+
+    report = maintenance.run_maintenance(fake_embeddings, known_text_hashes=["h-optics"])
+
+    assert report["removed_documents"] == 1
+    assert {text_hash for hashes in sources_by_id(fake_embeddings).values() for text_hash in hashes} == {"h-optics"}
+
+
+def test_reclaimed_bytes_are_only_reported_when_compaction_ran(maintenance, fake_embeddings, monkeypatch):
+    import create
+
+    for seed in range(6):
+        create.process_document_and_add_to_db(f"Doc {seed}", essay(seed, words=3000), f"h{seed}", fake_embeddings)
+
+    monkeypatch.setattr(maintenance, "MAINTENANCE_COMPACT", False)
+    report = maintenance.run_maintenance(fake_embeddings, known_text_hashes=["h0", "h1", "h2", "h3", "h4", "h5"])
+    assert report["compaction"]["status"] == "disabled"
+    assert report["reclaimed_bytes"] is None
+    assert "disabled" in report["reclaimed_bytes_reason"]
+
+    monkeypatch.setattr(maintenance, "MAINTENANCE_COMPACT", True)
+    report = maintenance.run_maintenance(fake_embeddings, known_text_hashes=["h0"])
+    if report["compaction"]["status"] == "skipped":
+        pytest.skip(report["compaction"]["reason"])
+    assert report["compaction"]["status"] == "complete"
+    assert report["reclaimed_bytes"] > 0
+    # The live store keeps working through the connections it already had open
+    assert collection(fake_embeddings).count() == report["chunks_after"]
+    create.process_document_and_add_to_db("After", essay(42), "h-after", fake_embeddings)
@@ -0,0 +1,108 @@
+import pytest
+
+TEXTS = [f"chunk {i} about lenses, refraction and focal length number {i}" for i in range(7)]
+
+
+@pytest.fixture
+def old_store(index_dir, make_embeddings):
+    """A user documents store embedded with an older model than the one the service is configured for."""
+    from langchain_community.vectorstores import Chroma
+    from embedding_backends import fingerprint_metadata
+
+    old_embeddings = make_embeddings("old-model")
+    return Chroma.from_texts(
+        TEXTS, old_embeddings, ids=[f"id-{i}" for i in range(len(TEXTS))],
+        persist_directory="./chroma_db", collection_metadata=fingerprint_metadata(old_embeddings),
+    )
+
+
+def collections():
+    import chromadb
+    import create
+    client = chromadb.PersistentClient(path=create.CHROMA_DB_PATH)
+    return {collection.name: collection for collection in client.list_collections()}
+
+
+def assert_migrated(embeddings):
+    from embedding_backends import collection_fingerprint, embedding_fingerprint
+
+    current = collections()
+    assert list(current) == ["langchain"]
+    assert collection_fingerprint(current["langchain"]) == embedding_fingerprint(embeddings)
+    stored = current["langchain"].get()
+    assert sorted(stored["ids"]) == sorted(f"id-{i}" for i in range(len(TEXTS)))
+
+
+def test_mismatched_store_is_refused_by_default(old_store, fake_embeddings):
+    import create
+    from embedding_backends import EmbeddingMismatch
+
+    with pytest.raises(EmbeddingMismatch):
+        create.verify_chroma_db(fake_embeddings, policy="refuse")
+
+
+def test_migration_re_embeds_and_swaps_in_the_new_collection(old_store, fake_embeddings):
+    import create
+
+    create.verify_chroma_db(fake_embeddings, policy="migrate")
+
+    assert fake_embeddings.texts == len(TEXTS)
+    assert_migrated(fake_embeddings)
+
+
+def test_interrupted_swap_is_finished_without_re_embedding(old_store, fake_embeddings, monkeypatch):
+    import create
+
+    original_swap = create._swap_in_migrated
+
+    def crash(*args):
+        raise RuntimeError("killed during the swap")
+    monkeypatch.setattr(create, "_swap_in_migrated", crash)
+    with pytest.raises(RuntimeError):
+        create.verify_chroma_db(fake_embeddings, policy="migrate")
+    assert collections()["langchain_migration"].metadata["migration_state"] == "copied"
+    monkeypatch.setattr(create, "_swap_in_migrated", original_swap)
+
+    embedded = fake_embeddings.texts
+    create.verify_chroma_db(fake_embeddings, policy="migrate")
+
+    assert fake_embeddings.texts == embedded
+    assert_migrated(fake_embeddings)
+
+
+def test_swap_interrupted_after_the_old_collection_was_moved_aside_is_finished(old_store, fake_embeddings, monkeypatch):
+    import create
+
+    original_swap = create._swap_in_migrated
+
+    def crash_after_backup(client, name, staging, embeddings):
+        client.get_collection(name).modify(name=name + create.MIGRATION_BACKUP_SUFFIX)
+        raise RuntimeError("killed between renames")
+    monkeypatch.setattr(create, "_swap_in_migrated", crash_after_backup)
+    with pytest.raises(RuntimeError):
+        create.verify_chroma_db(fake_embeddings, policy="migrate")
+    assert "langchain" not in collections()
+    monkeypatch.setattr(create, "_swap_in_migrated", original_swap)
+
+    embedded = fake_embeddings.texts
+    create.verify_chroma_db(fake_embeddings, policy="migrate")
+
+    assert fake_embeddings.texts == embedded
+    assert_migrated(fake_embeddings)
+
+
+def test_partly_copied_staging_collection_is_dropped_and_the_migration_re_run(old_store, fake_embeddings):
+    import create
+    from embedding_backends import fingerprint_metadata
+
+    staging = old_store._client.create_collection(
+        "langchain" + create.MIGRATION_STAGING_SUFFIX,
+        metadata={**fingerprint_metadata(fake_embeddings), create.MIGRATION_STATE_KEY: "copying"},
+    )
+    staging.add(ids=["id-0"], embeddings=[fake_embeddings.embed_query(TEXTS[0])], documents=[TEXTS[0]])
+    embedded = fake_embeddings.texts
+
+    create.verify_chroma_db(fake_embeddings, policy="migrate")
+
+    assert fake_embeddings.texts - embedded == len(TEXTS)
+    assert_migrated(fake_embeddings)
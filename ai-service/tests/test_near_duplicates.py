@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from near_duplicates import NearDuplicateIndex, minhash_signature
+
+
+def essay(seed, words=300):
+    rng = random.Random(seed)
+    return " ".join(f"term{rng.randrange(5000)}" for _ in range(words))
+
+
+def similarity(a, b):
+    return float((minhash_signature(a) == minhash_signature(b)).mean())
+
+
+def test_minhash_similarity_tracks_overlap():
+    text = essay(1)
+    words = text.split()
+    one_word_changed = " ".join(words[:150] + ["changed"] + words[151:])
+
+    assert similarity(text, text) == 1.0
+    assert similarity(text, text.upper()) == 1.0
+    assert similarity(text, one_word_changed) > 0.9
+    assert similarity(text, essay(2)) < 0.1
+
+
+def test_find_match_applies_the_threshold(tmp_path):
+    index = NearDuplicateIndex(path=str(tmp_path / "near.sqlite3"), threshold=0.85)
+    original = essay(1)
+    index.add_original("original", "Original notes", minhash_signature(original))
+
+    words = original.split()
+    near_copy = " ".join(words[:150] + ["changed"] + words[151:])
+    match = index.find_match(minhash_signature(near_copy))
+    assert match["text_hash"] == "original"
+    assert 0.85 <= match["similarity"] < 1.0
+
+    assert index.find_match(minhash_signature(essay(2))) is None
+
+    strict = NearDuplicateIndex(path=str(tmp_path / "near.sqlite3"), threshold=0.999)
+    assert strict.find_match(minhash_signature(near_copy)) is None
+
+
+def test_duplicates_and_removed_documents_are_not_matched(tmp_path):
+    index = NearDuplicateIndex(path=str(tmp_path / "near.sqlite3"))
+    original = essay(1)
+    index.add_original("original", "Original notes", minhash_signature(original))
+    index.add_duplicate("copy", "Copied notes", minhash_signature(original), "original", 1.0)
+
+    assert index.find_match(minhash_signature(original))["text_hash"] == "original"
+
+    index.remove_documents(["original"])
+    assert index.find_match(minhash_signature(original)) is None
@@ -0,0 +1,135 @@
+import asyncio
+from contextlib import contextmanager, asynccontextmanager
+
+import pytest
+
+from query_flow import ChatStep, CpuStep, arun_flow, run_flow
+
+
+class FakeReply:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeChain:
+    """Echoes its inputs, and fails when asked to."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    def _reply(self, mode, inputs):
+        self.calls.append(mode)
+        if self.fail:
+            raise RuntimeError("chat model unavailable")
+        return FakeReply(f"answer to {inputs['query']}")
+
+    def invoke(self, inputs):
+        return self._reply("sync", inputs)
+
+    async def ainvoke(self, inputs):
+        return self._reply("async", inputs)
+
+
+def answer_flow(chain, query):
+    words = yield CpuStep(str.split, query)
+    try:
+        reply = yield ChatStep(chain, {"query": " ".join(words)})
+        return reply.content
+    except RuntimeError as e:
+        return f"fallback ({e})"
+
+
+async def run_blocking(fn, *args):
+    return fn(*args)
+
+
+def test_sync_driver_invokes_the_chain():
+    chain = FakeChain()
+
+    assert run_flow(answer_flow(chain, " lens  formula ")) == "answer to lens formula"
+    assert chain.calls == ["sync"]
+
+
+def test_async_driver_awaits_the_chain_and_runs_cpu_steps_through_run_blocking():
+    chain = FakeChain()
+    cpu_calls = []
+
+    async def tracking_run_blocking(fn, *args):
+        cpu_calls.append(fn)
+        return fn(*args)
+
+    assert asyncio.run(arun_flow(answer_flow(chain, "lens formula"), tracking_run_blocking)) == "answer to lens formula"
+    assert chain.calls == ["async"]
+    assert cpu_calls == [str.split]
+
+
+@pytest.mark.parametrize("drive", [run_flow, lambda flow: asyncio.run(arun_flow(flow, run_blocking))])
+def test_step_errors_are_raised_inside_the_flow(drive):
+    assert drive(answer_flow(FakeChain(fail=True), "lens")) == "fallback (chat model unavailable)"
+
+
+def test_uncaught_step_errors_propagate_to_the_caller():
+    with pytest.raises(TypeError):
+        run_flow(answer_flow(FakeChain(), None))
+
+
+class RecordingAdmission:
+    """Records which steps ran while a slot was held."""
+
+    def __init__(self, reject=False):
+        self.reject = reject
+        self.held = False
+        self.entries = 0
+
+    @contextmanager
+    def admit(self):
+        if self.reject:
+            raise RuntimeError("shed")
+        self.entries += 1
+        self.held = True
+        try:
+            yield
+        finally:
+            self.held = False
+
+    @asynccontextmanager
+    async def admit_async(self):
+        with self.admit():
+            yield
+
+
+class SlotCheckingChain(FakeChain):
+    def __init__(self, admission):
+        super().__init__()
+        self.admission = admission
+        self.held_during_call = []
+
+    def _reply(self, mode, inputs):
+        self.held_during_call.append(self.admission.held)
+        return super()._reply(mode, inputs)
+
+
+def test_sync_driver_holds_a_slot_for_cpu_steps_only():
+    admission = RecordingAdmission()
+    chain = SlotCheckingChain(admission)
+
+    assert run_flow(answer_flow(chain, "lens"), admit=admission.admit) == "answer to lens"
+    assert admission.entries == 1
+    assert chain.held_during_call == [False]
+
+
+def test_async_driver_holds_a_slot_for_cpu_steps_only():
+    admission = RecordingAdmission()
+    chain = SlotCheckingChain(admission)
+
+    result = asyncio.run(arun_flow(answer_flow(chain, "lens"), run_blocking, admit=admission.admit_async))
+
+    assert result == "answer to lens"
+    assert admission.entries == 1
+    assert chain.held_during_call == [False]
+
+
+def test_rejected_admission_leaves_the_driver_instead_of_entering_the_flow():
+    with pytest.raises(RuntimeError, match="shed"):
+        run_flow(answer_flow(FakeChain(), "lens"), admit=RecordingAdmission(reject=True).admit)
@@ -0,0 +1,68 @@
+import pytest
+
+pytest.importorskip("langchain")
+
+from langchain.docstore.document import Document
+
+from retrieval import multi_query_search, reciprocal_rank_fusion
+
+
+def ranking(*chunk_ids):
+    return [(chunk_id, Document(page_content=chunk_id), 0.0) for chunk_id in chunk_ids]
+
+
+class FakeCollection:
+    """Answers every query vector with a fixed ranking per query, counting collection calls."""
+
+    def __init__(self, rankings):
+        self.rankings = rankings
+        self.queries = 0
+
+    def count(self):
+        return 10
+
+    def query(self, query_embeddings, n_results, include):
+        self.queries += 1
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for i in range(len(query_embeddings)):
+            ids = self.rankings[i][:n_results]
+            results["ids"].append(ids)
+            results["documents"].append(ids)
+            results["metadatas"].append([{} for _ in ids])
+            results["distances"].append([0.1 * rank for rank in range(len(ids))])
+        return results
+
+
+def test_fusion_rewards_chunks_ranked_well_in_several_rankings():
+    fused = reciprocal_rank_fusion([ranking("a", "b", "c"), ranking("b", "c", "d")], k=60)
+
+    assert [chunk_id for chunk_id, _, _ in fused] == ["b", "c", "a", "d"]
+    scores = {chunk_id: score for chunk_id, _, score in fused}
+    assert scores["b"] == pytest.approx(1 / 62 + 1 / 61)
+    assert scores["a"] == pytest.approx(1 / 61)
+
+
+def test_fusion_deduplicates_and_keeps_the_first_document_seen():
+    first = ranking("a")
+    second = [("a", Document(page_content="another copy"), 0.0)]
+
+    fused = reciprocal_rank_fusion([first, second])
+
+    assert len(fused) == 1
+    assert fused[0][1].page_content == "a"
+
+
+def test_fusion_of_nothing_is_empty():
+    assert reciprocal_rank_fusion([[], []]) == []
+
+
+def test_multi_query_search_embeds_and_searches_all_variants_at_once(fake_embeddings):
+    collection = FakeCollection([["a", "b", "c"], ["c", "a", "d"]])
+
+    hits = multi_query_search(collection, fake_embeddings, ["lens formula", "lens formula", "  ", "lens"], k=2)
+
+    # Blank and repeated variants are dropped; the rest share one model call and one collection query
+    assert fake_embeddings.calls == 1
+    assert fake_embeddings.texts == 2
+    assert collection.queries == 1
+    assert [chunk_id for chunk_id, _, _ in hits] == ["a", "c"]
@@ -0,0 +1,44 @@
+from search_policy import SearchMetrics, SearchPolicy
+
+
+def hits(*scores):
+    return [(f"chunk-{i}", None, score) for i, score in enumerate(scores)]
+
+
+def test_platform_questions_search_system_knowledge_first():
+    policy = SearchPolicy()
+
+    assert policy.search_order(platform_first=True) == ["system", "user"]
+    assert policy.search_order(platform_first=False) == ["user", "system"]
+
+
+def test_hits_below_the_relevance_threshold_are_dropped():
+    policy = SearchPolicy(relevance_threshold=0.6)
+
+    assert [score for _, _, score in policy.relevant(hits(0.9, 0.6, 0.59))] == [0.9, 0.6]
+
+
+def test_only_a_top_hit_at_the_decisive_score_settles_the_query():
+    policy = SearchPolicy(decisive_score=0.8)
+
+    assert policy.is_decisive(hits(0.8, 0.7))
+    assert not policy.is_decisive(hits(0.79))
+    assert not policy.is_decisive([])
+
+
+def test_short_circuit_can_be_disabled():
+    assert not SearchPolicy(decisive_score=0.8, short_circuit=False).is_decisive(hits(0.99))
+
+
+def test_metrics_count_searches_run_and_avoided():
+    metrics = SearchMetrics()
+    metrics.record(["user"], ["system"], has_context=True)
+    metrics.record(["user", "system"], [], has_context=False)
+    metrics.record([], ["system", "user"], has_context=True, lexical_only=True)
+
+    stats = metrics.stats()
+    assert stats["queries"] == 3
+    assert stats["searches_avoided"] == 3
+    assert stats["queries_without_context"] == 1
+    assert stats["lexical_only_queries"] == 1
+    assert stats["collections"]["user"] == {"searched": 2, "skipped": 1}
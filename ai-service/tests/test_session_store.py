@@ -0,0 +1,55 @@
+import session_store
+from session_store import SessionStore, is_follow_up_query
+
+
+def test_least_recently_updated_session_is_evicted_when_full():
+    store = SessionStore(max_sessions=2, ttl_seconds=60)
+    store.record_turn("a", "what is osmosis", "Osmosis is ...")
+    store.record_turn("b", "what is diffusion", "Diffusion is ...")
+    store.record_turn("a", "and in plants?", "In plants ...")
+    store.record_turn("c", "what is entropy", "Entropy is ...")
+
+    assert len(store) == 2
+    assert store.get("b") is None
+    assert store.get("a") is not None
+    assert store.get("c") is not None
+
+
+def test_expired_sessions_are_evicted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(session_store.time, "time", lambda: now[0])
+    store = SessionStore(max_sessions=10, ttl_seconds=30)
+    store.record_turn("a", "what is osmosis", "Osmosis is ...")
+    now[0] += 20
+    store.record_turn("b", "what is diffusion", "Diffusion is ...")
+
+    now[0] += 15
+    assert store.get("a") is None
+    assert store.get("b") is not None
+    assert len(store) == 1
+
+
+def test_turns_are_capped_and_chunk_ids_only_replaced_when_given():
+    store = SessionStore(max_turns=2)
+    store.record_turn("a", "q1", "a1", chunk_ids={"user": ["c1"]})
+    store.record_turn("a", "q2", "a2")
+    store.record_turn("a", "q3", "a3")
+
+    session = store.get("a")
+    assert "q1" not in session["summary"]
+    assert "q3" in session["summary"]
+    assert session["chunk_ids"] == {"user": ["c1"]}
+
+
+def test_follow_up_needs_cached_context_and_no_new_topic():
+    store = SessionStore()
+    store.record_turn(
+        "a", "what is photosynthesis", "Photosynthesis turns light into chemical energy.",
+        chunk_ids={"user": ["c1"]},
+    )
+    session = store.get("a")
+
+    assert is_follow_up_query("can you explain that again?", session)
+    assert is_follow_up_query("what does chemical energy mean in this?", session)
+    assert not is_follow_up_query("what about cellular respiration then?", session)
+    assert not is_follow_up_query("explain that again", {"summary": session["summary"], "chunk_ids": {}})
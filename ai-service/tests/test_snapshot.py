@@ -0,0 +1,98 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+
+TEXTS = [
+    "The lens formula relates focal length to object and image distances.",
+    "Snell's law describes refraction at the boundary between two media.",
+    "CS101 question 4 asks for a recursive definition of factorial.",
+    "Photosynthesis converts light energy into chemical energy in plants.",
+]
+
+
+@pytest.fixture
+def user_docs(index_dir, fake_embeddings):
+    from langchain_community.vectorstores import Chroma
+
+    return Chroma.from_texts(
+        TEXTS, fake_embeddings,
+        metadatas=[{"source": f"doc-{i}", "text_hash": f"h{i}"} for i in range(len(TEXTS))],
+        persist_directory="./chroma_db",
+    )
+
+
+def test_round_trip_preserves_chunks_and_nearest_neighbours(user_docs, fake_embeddings):
+    from snapshot import export_snapshot, load_snapshot
+
+    result = export_snapshot({"user_docs": user_docs, "system_knowledge": None}, fake_embeddings, path="snap.bin")
+    snapshot = load_snapshot(fake_embeddings, path="snap.bin")
+
+    assert result["collections"] == {"user_docs": len(TEXTS)}
+    restored = snapshot["user_docs"]
+    original = user_docs._collection.get(include=["documents", "metadatas"])
+    assert restored.get(ids=original["ids"], include=["documents", "metadatas"]) == {
+        "ids": original["ids"], "documents": original["documents"], "metadatas": original["metadatas"],
+    }
+
+    query = fake_embeddings.embed_query("refraction between two media")
+    expected = user_docs._collection.query(query_embeddings=[query], n_results=2, include=["distances"])
+    actual = restored.query(query_embeddings=[query], n_results=2, include=["distances"])
+    assert actual["ids"] == expected["ids"]
+    assert actual["distances"][0] == pytest.approx(expected["distances"][0], abs=1e-5)
+
+
+def test_bundled_files_are_restored_without_overwriting_local_ones(user_docs, fake_embeddings, tmp_path):
+    from snapshot import export_snapshot, restore_snapshot_files
+
+    (tmp_path / "faq.json").write_text('{"fingerprint": "f"}')
+    (tmp_path / "lexical.bin").write_bytes(b"\x00\x01lexical")
+    export_snapshot({"user_docs": user_docs}, fake_embeddings, path="snap.bin",
+                    files={"faq_table": "faq.json", "lexical_index": "lexical.bin"})
+
+    (tmp_path / "local_faq.json").write_text("local")
+    restored = restore_snapshot_files(
+        {"faq_table": "local_faq.json", "lexical_index": "restored_lexical.bin"}, path="snap.bin",
+    )
+
+    assert restored == ["lexical_index"]
+    assert (tmp_path / "restored_lexical.bin").read_bytes() == b"\x00\x01lexical"
+    assert (tmp_path / "local_faq.json").read_text() == "local"
+
+
+def test_snapshot_from_another_embedding_model_is_refused(user_docs, fake_embeddings, make_embeddings):
+    from snapshot import SnapshotError, export_snapshot, load_snapshot
+
+    export_snapshot({"user_docs": user_docs}, fake_embeddings, path="snap.bin")
+
+    with pytest.raises(SnapshotError):
+        load_snapshot(make_embeddings("another-model"), path="snap.bin")
+
+
+def test_format_1_snapshots_still_load(user_docs, fake_embeddings, tmp_path):
+    from snapshot import export_snapshot, load_snapshot, restore_snapshot_files
+
+    export_snapshot({"user_docs": user_docs}, fake_embeddings, path="snap.bin")
+    # Same header length, so every offset stays valid
+    data = (tmp_path / "snap.bin").read_bytes()
+    (tmp_path / "snap.bin").write_bytes(data.replace(b'"format_version": 2', b'"format_version": 1', 1))
+
+    assert load_snapshot(fake_embeddings, path="snap.bin")["user_docs"].count() == len(TEXTS)
+    assert restore_snapshot_files({"faq_table": "faq.json"}, path="snap.bin") == []
+
+
+def test_import_copies_stored_vectors_without_embedding(user_docs, fake_embeddings):
+    from langchain_community.vectorstores import Chroma
+    from snapshot import export_snapshot, import_snapshot_collection, load_snapshot
+
+    export_snapshot({"user_docs": user_docs}, fake_embeddings, path="snap.bin")
+    snapshot_docs = load_snapshot(fake_embeddings, path="snap.bin")["user_docs"]
+    calls_before = fake_embeddings.calls
+
+    replica = Chroma(persist_directory="./replica_db", embedding_function=fake_embeddings)
+    import_snapshot_collection(snapshot_docs, replica)
+
+    assert fake_embeddings.calls == calls_before
+    assert replica._collection.count() == len(TEXTS)
+    copied = replica._collection.get(ids=snapshot_docs.ids[:1], include=["embeddings"])
+    assert copied["embeddings"][0] == pytest.approx(snapshot_docs.vectors[0].tolist())